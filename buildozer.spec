@@ -35,7 +35,7 @@ version = 4.45
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3,kivy,openssl
+requirements = python3,kivy,openssl,numpy
 
 # (str) Custom source folders for requirements
 # Sets custom source for any requirements with recipes
@@ -8,82 +8,21 @@ from kivy.clock import Clock
 from kivy.graphics import *
 import math
 import random
+import numpy as np
+from render_batch import ColorMeshBatch
+from math3d import Vector3
+from maze_mesh import MazeMesh
+from occlusion import OcclusionBuffer
+from raycaster import GridRaycaster
 
 # Настройки окна
 Window.size = (1024, 768)
 Window.clearcolor = (0.1, 0.1, 0.1, 1)
 
-class Vector3:
-    def __init__(self, x=0, y=0, z=0):
-        self.x = x
-        self.y = y
-        self.z = z
-    
-    def __add__(self, other):
-        return Vector3(self.x + other.x, self.y + other.y, self.z + other.z)
-    
-    def __sub__(self, other):
-        return Vector3(self.x - other.x, self.y - other.y, self.z - other.z)
-    
-    def __mul__(self, scalar):
-        return Vector3(self.x * scalar, self.y * scalar, self.z * scalar)
-    
-    def __copy__(self):
-        return Vector3(self.x, self.y, self.z)
-    
-    def copy(self):
-        return Vector3(self.x, self.y, self.z)
-    
-    def normalize(self):
-        length = math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
-        if length > 0:
-            return Vector3(self.x/length, self.y/length, self.z/length)
-        return Vector3(0, 0, 0)
-    
-    def length(self):
-        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
-    
-    def rotate_y(self, angle):
-        cos_a = math.cos(angle)
-        sin_a = math.sin(angle)
-        x = self.x * cos_a + self.z * sin_a
-        z = -self.x * sin_a + self.z * cos_a
-        return Vector3(x, self.y, z)
-    
-    def rotate_x(self, angle):
-        cos_a = math.cos(angle)
-        sin_a = math.sin(angle)
-        y = self.y * cos_a - self.z * sin_a
-        z = self.y * sin_a + self.z * cos_a
-        return Vector3(self.x, y, z)
-    
-    def cross(self, other):
-        """Векторное произведение"""
-        return Vector3(
-            self.y * other.z - self.z * other.y,
-            self.z * other.x - self.x * other.z,
-            self.x * other.y - self.y * other.x
-        )
-    
-    def dot(self, other):
-        """Скалярное произведение"""
-        return self.x * other.x + self.y * other.y + self.z * other.z
-    
-    def distance(self, other):
-        """Расстояние до другой точки"""
-        dx = self.x - other.x
-        dy = self.y - other.y
-        dz = self.z - other.z
-        return math.sqrt(dx*dx + dy*dy + dz*dz)
-    
-    def distance2d(self, other):
-        """Расстояние только по XZ плоскости"""
-        dx = self.x - other.x
-        dz = self.z - other.z
-        return math.sqrt(dx*dx + dz*dz)
-
 class BoundingBox:
     """Ограничивающая рамка для столкновений"""
+    __slots__ = ('min', 'max')
+    
     def __init__(self, min_point, max_point):
         self.min = Vector3(min(min_point.x, max_point.x), 
                           min(min_point.y, max_point.y), 
@@ -150,15 +89,16 @@ class Camera:
         cos_x = math.cos(self.rotation.x)
         sin_x = math.sin(self.rotation.x)
         
-        self.forward = Vector3(
+        # Векторы обновляются на месте, без временных объектов
+        self.forward.set(
             sin_y * cos_x,
             sin_x,
             cos_y * cos_x
-        ).normalize()
+        ).normalize_ip()
         
-        world_up = Vector3(0, 1, 0)
-        self.right = world_up.cross(self.forward).normalize()
-        self.up = self.forward.cross(self.right).normalize()
+        # world_up x forward для world_up = (0, 1, 0)
+        self.right.set(self.forward.z, 0, -self.forward.x).normalize_ip()
+        self.up = self.forward.cross(self.right).normalize_ip()
     
     def get_bounding_box(self):
         """Возвращает ограничивающую рамку игрока"""
@@ -173,15 +113,23 @@ class Camera:
                    self.position.z + half_size)
         )
     
-    def check_wall_collision(self, walls, old_pos):
-        """Проверяет столкновение со стенами и корректирует позицию"""
-        # Сначала проверяем по горизонтали (XZ)
-        test_pos = self.position.copy()
+    def check_wall_collision(self, wall_grid, old_pos):
+        """Проверяет столкновение со стенами этажа (WallGrid) и корректирует позицию"""
+        # Проверяются только стены у пути игрока с прошлого шага; запас
+        # сетки покрывает выталкивание, сдвигающее игрока за эти рамки
+        walls = wall_grid.query(
+            min(old_pos.x, self.position.x) - self.radius,
+            min(old_pos.z, self.position.z) - self.radius,
+            max(old_pos.x, self.position.x) + self.radius,
+            max(old_pos.z, self.position.z) + self.radius)
+        
+        # Сначала проверяем по горизонтали (XZ);
+        # рамка игрока пересчитывается только после сдвига позиции
+        player_bb = self.get_bounding_box()
         
         # Проверяем каждую стену
         for wall in walls:
             wall_bb = wall.get_bounding_box()
-            player_bb = self.get_bounding_box()
             
             if wall_bb.intersects(player_bb):
                 # Столкновение обнаружено, корректируем позицию
@@ -217,27 +165,26 @@ class Camera:
                 # Применяем корректировку
                 self.position.x += dx
                 self.position.z += dz
+                player_bb = self.get_bounding_box()
         
         # После коррекции проверяем вертикальные столкновения
         for wall in walls:
             wall_bb = wall.get_bounding_box()
-            player_bb = self.get_bounding_box()
             
             if wall_bb.intersects(player_bb):
                 # Вертикальное столкновение (потолок/пол стены)
-                player_center = player_bb.get_center()
-                wall_center = wall_bb.get_center()
-                
                 # Если игрок падает на стену сверху
                 if old_pos.y > wall_bb.max.y and self.position.y <= wall_bb.max.y:
                     self.position.y = wall_bb.max.y + 0.01
                     self.velocity.y = 0
+                    player_bb = self.get_bounding_box()
                 # Если игрок ударяется головой о стену снизу
                 elif old_pos.y + self.height < wall_bb.min.y and self.position.y + self.height >= wall_bb.min.y:
                     self.position.y = wall_bb.min.y - self.height - 0.01
                     self.velocity.y = 0
+                    player_bb = self.get_bounding_box()
     
-    def update_physics(self, dt, walls, floor_y=0):
+    def update_physics(self, dt, wall_grid, floor_y=0):
         """Обновление физики с учетом столкновений"""
         old_pos = self.position.copy()
         
@@ -267,7 +214,7 @@ class Camera:
         self.position.y += self.velocity.y * dt
         
         # Проверяем столкновение со стенами
-        self.check_wall_collision(walls, old_pos)
+        self.check_wall_collision(wall_grid, old_pos)
         
         # Проверяем столкновение с землей
         if self.position.y < floor_y + 1.8:
@@ -283,16 +230,22 @@ class Camera:
                 self.position.y += direction_z * self.stair_speed * dt
         else:
             if direction_x != 0 or direction_z != 0:
-                move_direction = Vector3(direction_x, 0, direction_z).normalize()
+                # Направление в плоскости XZ считается на скалярах, без временных векторов
+                length = math.hypot(direction_x, direction_z)
+                move_x = direction_x / length
+                move_z = direction_z / length
                 
-                rotated_direction = Vector3(
-                    move_direction.x * self.right.x + move_direction.z * self.forward.x,
-                    0,
-                    move_direction.x * self.right.z + move_direction.z * self.forward.z
-                ).normalize()
+                rotated_x = move_x * self.right.x + move_z * self.forward.x
+                rotated_z = move_x * self.right.z + move_z * self.forward.z
+                length = math.hypot(rotated_x, rotated_z)
+                if length > 0:
+                    rotated_x /= length
+                    rotated_z /= length
+                else:
+                    rotated_x = rotated_z = 0
                 
-                target_velocity_x = rotated_direction.x * self.current_speed
-                target_velocity_z = rotated_direction.z * self.current_speed
+                target_velocity_x = rotated_x * self.current_speed
+                target_velocity_z = rotated_z * self.current_speed
                 
                 self.velocity.x += (target_velocity_x - self.velocity.x) * self.acceleration * dt
                 self.velocity.z += (target_velocity_z - self.velocity.z) * self.acceleration * dt
@@ -334,64 +287,133 @@ class Camera:
         self.rotation.x = max(-math.pi/2 + 0.1, min(math.pi/2 - 0.1, self.rotation.x))
         self.update_vectors()
 
+class ViewTransform:
+    """Преобразование вида камеры, вычисленное один раз на кадр.
+    
+    Тригонометрия поворота считается в конструкторе; точки переводятся
+    в пространство камеры и проецируются на экран по одной или массивами
+    """
+    __slots__ = ('position', 'yaw', 'cos_y', 'sin_y', 'cos_x', 'sin_x',
+                 'center_x', 'center_y', 'focal', 'near')
+    
+    def __init__(self, camera, width, height, focal, near=0.1):
+        self.position = camera.position.copy()
+        self.yaw = camera.rotation.y
+        self.cos_y = math.cos(-camera.rotation.y)
+        self.sin_y = math.sin(-camera.rotation.y)
+        self.cos_x = math.cos(-camera.rotation.x)
+        self.sin_x = math.sin(-camera.rotation.x)
+        self.center_x = width / 2
+        self.center_y = height / 2
+        self.focal = focal
+        
+        # Точки ближе near проецируются с масштабом focal / near
+        self.near = near
+    
+    def to_camera(self, point):
+        """Координаты точки в пространстве камеры"""
+        dx = point.x - self.position.x
+        dy = point.y - self.position.y
+        dz = point.z - self.position.z
+        
+        x = dx * self.cos_y + dz * self.sin_y
+        z = -dx * self.sin_y + dz * self.cos_y
+        
+        return (x, dy * self.cos_x - z * self.sin_x, dy * self.sin_x + z * self.cos_x)
+    
+    def to_camera_array(self, points):
+        """Координаты массива точек (n, 3) в пространстве камеры"""
+        d = points - self.position.to_tuple()
+        x = d[:, 0] * self.cos_y + d[:, 2] * self.sin_y
+        z = -d[:, 0] * self.sin_y + d[:, 2] * self.cos_y
+        
+        result = np.empty_like(d)
+        result[:, 0] = x
+        result[:, 1] = d[:, 1] * self.cos_x - z * self.sin_x
+        result[:, 2] = d[:, 1] * self.sin_x + z * self.cos_x
+        return result
+    
+    def horizontal_depth(self, point):
+        """Расстояние до точки вдоль взгляда в плоскости пола (без наклона)"""
+        return (-(point.x - self.position.x) * self.sin_y +
+                (point.z - self.position.z) * self.cos_y)
+    
+    def project_camera(self, point):
+        """Проекция точки пространства камеры на экран: (x, y, глубина)"""
+        x, y, z = point
+        factor = self.focal / (z if z > self.near else self.near)
+        return (x * factor + self.center_x, y * factor + self.center_y, z)
+    
+    def project_camera_array(self, points):
+        """Проекция массива точек пространства камеры: массивы x, y и глубины"""
+        z = points[:, 2]
+        factor = self.focal / np.maximum(z, self.near)
+        return (points[:, 0] * factor + self.center_x,
+                points[:, 1] * factor + self.center_y, z)
+    
+    def project_point(self, point):
+        """Проекция одной точки мира на экран: (x, y, глубина)"""
+        return self.project_camera(self.to_camera(point))
+    
+    def project(self, points):
+        """Проекция массива точек мира (n, 3): массивы x, y и глубины"""
+        return self.project_camera_array(self.to_camera_array(points))
+
 class Wall:
-    """Стена лабиринта с физической коллизией"""
+    """Стена лабиринта с физической коллизией.
+    
+    Вершины, грани и рамка в мировых координатах статичны: они считаются
+    при создании и в move_to, а get_* отдают готовые значения, которые
+    нельзя изменять
+    """
+    # Грани по индексам вершин: -z, +z, -x, +x, верх, низ
+    FACES = ((4, 5, 1, 0), (7, 6, 2, 3), (4, 0, 3, 7), (5, 1, 2, 6), (4, 5, 6, 7), (0, 1, 2, 3))
+    
     def __init__(self, x=0, y=0, z=0, width=1, depth=1, height=3):
-        self.position = Vector3(x, y, z)
         self.width = width
         self.depth = depth
         self.height = height
         self.color = (0.7, 0.7, 0.7, 1)
+        self.move_to(x, y, z)
     
-    def get_bounding_box(self):
-        """Возвращает ограничивающую рамку стены"""
-        w2 = self.width / 2
-        d2 = self.depth / 2
-        
-        return BoundingBox(
-            Vector3(self.position.x - w2, 
-                   self.position.y, 
-                   self.position.z - d2),
-            Vector3(self.position.x + w2, 
-                   self.position.y + self.height, 
-                   self.position.z + d2)
-        )
+    def move_to(self, x, y, z):
+        """Перенос стены с пересчетом геометрии"""
+        self.position = Vector3(x, y, z)
+        self.update_geometry()
     
-    def get_vertices(self):
-        """Возвращает вершины стены"""
+    def update_geometry(self):
+        """Пересчет вершин, граней и рамки в мировых координатах"""
         w2 = self.width / 2
         d2 = self.depth / 2
         
-        vertices = [
-            Vector3(-w2, 0, -d2),
-            Vector3(w2, 0, -d2),
-            Vector3(w2, 0, d2),
-            Vector3(-w2, 0, d2),
-            Vector3(-w2, self.height, -d2),
-            Vector3(w2, self.height, -d2),
-            Vector3(w2, self.height, d2),
-            Vector3(-w2, self.height, d2)
+        corners = [
+            (-w2, 0, -d2),
+            (w2, 0, -d2),
+            (w2, 0, d2),
+            (-w2, 0, d2),
+            (-w2, self.height, -d2),
+            (w2, self.height, -d2),
+            (w2, self.height, d2),
+            (-w2, self.height, d2)
         ]
         
-        for i in range(8):
-            vertices[i] = vertices[i] + self.position
-        
-        return vertices
+        self.vertex_array = np.array(corners, dtype=np.float64) + self.position.to_tuple()
+        self.vertex_array.flags.writeable = False
+        self.vertices = tuple(Vector3(*v) for v in self.vertex_array.tolist())
+        self.faces = tuple(tuple(self.vertices[k] for k in face) for face in self.FACES)
+        self.bounding_box = BoundingBox(self.vertices[0], self.vertices[6])
+    
+    def get_bounding_box(self):
+        """Возвращает ограничивающую рамку стены"""
+        return self.bounding_box
+    
+    def get_vertices(self):
+        """Возвращает вершины стены"""
+        return self.vertices
     
     def get_faces(self):
         """Возвращает грани стены"""
-        vertices = self.get_vertices()
-        
-        faces = [
-            [vertices[4], vertices[5], vertices[1], vertices[0]],
-            [vertices[7], vertices[6], vertices[2], vertices[3]],
-            [vertices[4], vertices[0], vertices[3], vertices[7]],
-            [vertices[5], vertices[1], vertices[2], vertices[6]],
-            [vertices[4], vertices[5], vertices[6], vertices[7]],
-            [vertices[0], vertices[1], vertices[2], vertices[3]]
-        ]
-        
-        return faces
+        return self.faces
     
     def is_player_colliding(self, player_pos, player_radius, player_height):
         """Проверяет столкновение игрока со стеной"""
@@ -414,10 +436,56 @@ class Wall:
         
         return horizontal_distance < player_radius and vertical_overlap
 
+class WallGrid:
+    """Равномерная сетка по XZ над рамками стен этажа для широкой фазы коллизий.
+    
+    Стена любого размера записывается во все клетки, которые перекрывает
+    ее рамка. Запрос возвращает стены из клеток прямоугольника, расширенного
+    на margin, в порядке исходного списка, поэтому результат проверки
+    столкновений не зависит от сетки
+    """
+    def __init__(self, walls, cell_size=4, margin=None):
+        self.walls = list(walls)
+        self.cell_size = cell_size
+        self.margin = cell_size if margin is None else margin
+        
+        # Клетка (cx, cz) -> индексы стен в self.walls
+        self.cells = {}
+        for index, wall in enumerate(self.walls):
+            bb = wall.get_bounding_box()
+            for key in self.cell_keys(bb.min.x, bb.min.z, bb.max.x, bb.max.z):
+                self.cells.setdefault(key, []).append(index)
+    
+    def cell_keys(self, min_x, min_z, max_x, max_z):
+        """Клетки сетки, перекрытые прямоугольником"""
+        size = self.cell_size
+        for cx in range(math.floor(min_x / size), math.floor(max_x / size) + 1):
+            for cz in range(math.floor(min_z / size), math.floor(max_z / size) + 1):
+                yield (cx, cz)
+    
+    def query(self, min_x, min_z, max_x, max_z):
+        """Стены, рамки которых могут пересекать прямоугольник с запасом margin"""
+        margin = self.margin
+        found = set()
+        for key in self.cell_keys(min_x - margin, min_z - margin, max_x + margin, max_z + margin):
+            found.update(self.cells.get(key, ()))
+        return [self.walls[index] for index in sorted(found)]
+    
+    def __iter__(self):
+        return iter(self.walls)
+    
+    def __len__(self):
+        return len(self.walls)
+
 class Staircase:
-    """Лестница между этажами"""
+    """Лестница между этажами.
+    
+    Вершины ступеней и рамка считаются при создании и в move_to
+    """
+    # Видимые грани ступени по индексам ее вершин: верх, передняя и боковые
+    STEP_FACES = ((4, 5, 6, 7), (4, 5, 1, 0), (5, 1, 2, 6), (4, 0, 3, 7))
+    
     def __init__(self, x=0, z=0, width=2, depth=6, height=5, steps=12):
-        self.position = Vector3(x, 0, z)
         self.width = width
         self.depth = depth
         self.height = height
@@ -425,13 +493,57 @@ class Staircase:
         self.step_height = height / steps
         self.step_depth = depth / steps
         self.color = (0.6, 0.4, 0.2, 1)
+        
+        # Ступени темнеют к верху лестницы
+        self.step_colors = tuple(
+            (self.color[0] * (1 - i / steps * 0.3),
+             self.color[1] * (1 - i / steps * 0.3),
+             self.color[2],
+             self.color[3])
+            for i in range(steps))
+        
+        # Видимые грани всех ступеней: индексы углов в vertex_array и цвет грани
+        self.face_indices = np.array([[i * 8 + k for k in face] for i in range(steps)
+                                      for face in self.STEP_FACES], dtype=np.int64)
+        self.face_colors = np.repeat(np.array(self.step_colors, dtype=np.float64),
+                                     len(self.STEP_FACES), axis=0)
+        self.move_to(x, z)
     
-    def get_bounding_box(self):
-        """Возвращает ограничивающую рамку всей лестницы"""
+    def move_to(self, x, z):
+        """Перенос лестницы с пересчетом геометрии"""
+        self.position = Vector3(x, 0, z)
+        self.update_geometry()
+    
+    def update_geometry(self):
+        """Пересчет вершин ступеней и рамки в мировых координатах"""
         w2 = self.width / 2
-        d2 = self.depth / 2
+        corners = []
         
-        return BoundingBox(
+        for i in range(self.steps):
+            step_y = i * self.step_height
+            step_z = i * self.step_depth
+            
+            corners += [
+                (-w2, step_y, -self.depth/2 + step_z),
+                (w2, step_y, -self.depth/2 + step_z),
+                (w2, step_y, -self.depth/2 + step_z + self.step_depth),
+                (-w2, step_y, -self.depth/2 + step_z + self.step_depth),
+                (-w2, step_y + self.step_height, -self.depth/2 + step_z),
+                (w2, step_y + self.step_height, -self.depth/2 + step_z),
+                (w2, step_y + self.step_height, -self.depth/2 + step_z + self.step_depth),
+                (-w2, step_y + self.step_height, -self.depth/2 + step_z + self.step_depth)
+            ]
+        
+        # Вершины всех ступеней подряд, по 8 на ступень
+        self.vertex_array = np.array(corners, dtype=np.float64) + self.position.to_tuple()
+        self.vertex_array.flags.writeable = False
+        vertices = [Vector3(*v) for v in self.vertex_array.tolist()]
+        self.steps_vertices = tuple(tuple(vertices[i:i + 8]) for i in range(0, len(vertices), 8))
+        self.faces = tuple(tuple(vertices[k] for k in face) for face in self.face_indices.tolist())
+        
+        w2 = self.width / 2
+        d2 = self.depth / 2
+        self.bounding_box = BoundingBox(
             Vector3(self.position.x - w2, 
                    self.position.y, 
                    self.position.z - d2),
@@ -440,32 +552,13 @@ class Staircase:
                    self.position.z + d2)
         )
     
+    def get_bounding_box(self):
+        """Возвращает ограничивающую рамку всей лестницы"""
+        return self.bounding_box
+    
     def get_steps_vertices(self):
         """Возвращает вершины всех ступенек"""
-        steps_vertices = []
-        
-        for i in range(self.steps):
-            step_y = i * self.step_height
-            step_z = i * self.step_depth
-            
-            w2 = self.width / 2
-            vertices = [
-                Vector3(-w2, step_y, -self.depth/2 + step_z),
-                Vector3(w2, step_y, -self.depth/2 + step_z),
-                Vector3(w2, step_y, -self.depth/2 + step_z + self.step_depth),
-                Vector3(-w2, step_y, -self.depth/2 + step_z + self.step_depth),
-                Vector3(-w2, step_y + self.step_height, -self.depth/2 + step_z),
-                Vector3(w2, step_y + self.step_height, -self.depth/2 + step_z),
-                Vector3(w2, step_y + self.step_height, -self.depth/2 + step_z + self.step_depth),
-                Vector3(-w2, step_y + self.step_height, -self.depth/2 + step_z + self.step_depth)
-            ]
-            
-            for j in range(8):
-                vertices[j] = vertices[j] + self.position
-            
-            steps_vertices.append(vertices)
-        
-        return steps_vertices
+        return self.steps_vertices
     
     def is_player_near(self, player_pos, radius=3.0):
         """Проверяет, находится ли игрок рядом с лестницей"""
@@ -498,6 +591,9 @@ class Game3D(Widget):
         # Создаем пол
         self.create_floors()
         
+        # Постоянные слои отрисовки
+        self.setup_layers()
+        
         # Управление
         self.keys_pressed = set()
         self.last_mouse_pos = None
@@ -518,6 +614,22 @@ class Game3D(Widget):
         self.collision_info = "Нет столкновений"
         self.collision_count = 0
         
+        # Отсечение перекрытием (клавиша O) и статистика кадра; по умолчанию
+        # выключено - после PVS за стенами почти не остается граней
+        self.occlusion = OcclusionBuffer()
+        self.occlusion_culling = False
+        self.max_occluders = 8
+        self.render_stats = {}
+        
+        # 'polygons' - грани лабиринта через проекцию, 'raycast' - полосы стен
+        # лучами по сетке (клавиша R)
+        self.render_mode = 'polygons'
+        
+        # Фокусное расстояние проекции в пикселях: одно для преобразования
+        # вида и для направлений лучей, иначе полосы не совпадут с экраном
+        self.focal = 500
+        self.raycaster = GridRaycaster(self.maze_mesh, self.focal)
+        
         # Настройка ввода
         self.setup_input()
         
@@ -531,7 +643,7 @@ class Game3D(Widget):
         wall_height = 3
         
         # Первый этаж - больше стен
-        maze_layout_first = [
+        self.maze_layout_first = maze_layout_first = [
             [1,1,1,1,1,1,1,1,1,1],
             [1,0,0,0,0,0,0,0,0,1],
             [1,0,0,0,0,0,0,0,0,1],
@@ -545,7 +657,7 @@ class Game3D(Widget):
         ]
         
         # Второй этаж - другой лабиринт
-        maze_layout_second = [
+        self.maze_layout_second = maze_layout_second = [
             [1,1,1,1,1,1,1,1,1,1],
             [1,0,0,0,0,0,0,0,0,1],
             [1,0,0,0,0,0,0,0,0,1],
@@ -574,6 +686,14 @@ class Game3D(Widget):
                     wall = Wall(wall_x, self.floor_height, wall_z, cell_size, cell_size, wall_height)
                     self.walls_second_floor.append(wall)
         
+        self.maze_size = maze_size
+        self.cell_size = cell_size
+        self.wall_height = wall_height
+        
+        # Статическая сетка лабиринта без внутренних граней
+        self.maze_mesh = MazeMesh(maze_size, cell_size, wall_height)
+        self.maze_mesh.build([(maze_layout_first, 0), (maze_layout_second, self.floor_height)])
+        
         # Добавляем несколько случайных стен для тестирования коллизий
         for _ in range(5):
             wall = Wall(
@@ -585,8 +705,17 @@ class Game3D(Widget):
                 wall_height
             )
             self.walls_first_floor.append(wall)
+            self.maze_mesh.add_box(wall)
+        
+        # Потенциально видимые грани для каждой свободной клетки
+        self.maze_mesh.build_pvs()
         
-        print(f"Создано стен: 1 этаж - {len(self.walls_first_floor)}, 2 этаж - {len(self.walls_second_floor)}")
+        # Сетки стен для коллизий, по одной на этаж, вместе со случайными стенами
+        self.wall_grid_first = WallGrid(self.walls_first_floor, cell_size)
+        self.wall_grid_second = WallGrid(self.walls_second_floor, cell_size)
+        
+        print(f"Создано стен: 1 этаж - {len(self.walls_first_floor)}, 2 этаж - {len(self.walls_second_floor)}, "
+              f"граней: {len(self.maze_mesh.faces)}, областей PVS: {len(self.maze_mesh.pvs_sets)}")
     
     def create_floors(self):
         """Создание полов для двух этажей"""
@@ -613,6 +742,12 @@ class Game3D(Widget):
                 Vector3(i, self.floor_height, -size),
                 Vector3(i, self.floor_height, size)
             ))
+        
+        # Концы линий подряд (начало, конец) для пакетной проекции
+        # и цвет каждого конца для буфера отрезков
+        self.floor_line_points = np.array([v.to_tuple() for line in self.floor_lines for v in line],
+                                          dtype=np.float64)
+        self.floor_line_colors = np.tile((0.4, 0.4, 0.4, 0.5), (len(self.floor_lines), 2, 1))
     
     def setup_ui(self):
         """Настройка интерфейса"""
@@ -712,6 +847,10 @@ class Game3D(Widget):
             if not self.camera.on_stairs and self.camera.jump_count < self.camera.max_jumps:
                 self.camera.jump()
                 self.space_pressed = True
+        elif key == 'o':
+            self.occlusion_culling = not self.occlusion_culling
+        elif key == 'r':
+            self.render_mode = 'raycast' if self.render_mode == 'polygons' else 'polygons'
         elif key in ['w', 'a', 's', 'd', 'shift', 'left', 'right', 'up', 'down']:
             self.keys_pressed.add(key)
         
@@ -749,9 +888,12 @@ class Game3D(Widget):
     def check_collisions_debug(self):
         """Отладочная проверка столкновений"""
         self.collision_count = 0
-        walls = self.walls_first_floor if self.current_floor == 1 else self.walls_second_floor
+        wall_grid = self.wall_grid_first if self.current_floor == 1 else self.wall_grid_second
+        position = self.camera.position
+        radius = self.camera.radius
         
-        for wall in walls:
+        for wall in wall_grid.query(position.x - radius, position.z - radius,
+                                    position.x + radius, position.z + radius):
             if wall.is_player_colliding(self.camera.position, self.camera.radius, self.camera.height):
                 self.collision_count += 1
         
@@ -772,11 +914,11 @@ class Game3D(Widget):
         if self.camera.position.y < self.floor_height + 1.0:
             self.current_floor = 1
             floor_y = 0
-            current_walls = self.walls_first_floor
+            current_walls = self.wall_grid_first
         else:
             self.current_floor = 2
             floor_y = self.floor_height
-            current_walls = self.walls_second_floor
+            current_walls = self.wall_grid_second
         
         # Проверяем столкновение с лестницей
         on_stairs = self.check_stair_collision()
@@ -862,123 +1004,149 @@ class Game3D(Widget):
         # Отрисовка
         self.draw()
     
+    def setup_layers(self):
+        """Создание постоянных слоев отрисовки: фон, мир и отладка"""
+        # Слои лежат в canvas.before, поэтому метки интерфейса остаются поверх
+        layers = self.canvas.before
+        
+        # Темный фон
+        self.background_layer = InstructionGroup()
+        self.background_layer.add(Color(0.05, 0.05, 0.05, 1))
+        self.background_rect = Rectangle(pos=(0, 0), size=(self.width, self.height))
+        self.background_layer.add(self.background_rect)
+        
+        # Мир: полы, сетка пола, стены и лестница
+        self.world_layer = InstructionGroup()
+        self.world_layer.add(Color(0.3, 0.3, 0.3, 1))
+        self.ground_mesh = Mesh(vertices=[], indices=[], mode='triangles')
+        self.world_layer.add(self.ground_mesh)
+        self.world_layer.add(Color(0.35, 0.35, 0.35, 1))
+        self.second_floor_mesh = Mesh(vertices=[], indices=[], mode='triangles')
+        self.world_layer.add(self.second_floor_mesh)
+        
+        # Сетка пола обоих этажей - один Mesh в режиме отрезков
+        self.floor_line_batch = ColorMeshBatch(mode='lines')
+        self.world_layer.add(self.floor_line_batch.context)
+        
+        self.world_batch = ColorMeshBatch()
+        self.world_layer.add(self.world_batch.context)
+        
+        # Отладочные рамки коллизий
+        self.debug_layer = InstructionGroup()
+        self.debug_visible = False
+        
+        layers.add(self.background_layer)
+        layers.add(self.world_layer)
+        layers.add(self.debug_layer)
+    
+    def draw_floor(self, mesh, y, view):
+        """Обновление вершин пола на высоте y"""
+        ground_size = 50
+        floor_vertices = np.array([
+            (-ground_size, y, -ground_size),
+            (ground_size, y, -ground_size),
+            (ground_size, y, ground_size),
+            (-ground_size, y, ground_size)
+        ], dtype=np.float64)
+        
+        sx, sy, depth = view.project(floor_vertices)
+        front = depth > 0.1
+        
+        if front.all():
+            mesh.vertices = [
+                sx[0], sy[0], 0, 0,
+                sx[1], sy[1], 0, 0,
+                sx[2], sy[2], 0, 0,
+                sx[3], sy[3], 0, 0
+            ]
+            mesh.indices = [0, 1, 2, 0, 2, 3]
+        else:
+            mesh.vertices = []
+            mesh.indices = []
+    
     def draw(self):
         """Отрисовка сцены"""
-        self.canvas.clear()
-        
-        with self.canvas:
-            # Темный фон
-            Color(0.05, 0.05, 0.05, 1)
-            Rectangle(pos=(0, 0), size=(self.width, self.height))
-            
-            # Рисуем пол первого этажа
-            Color(0.3, 0.3, 0.3, 1)
-            ground_size = 50
-            ground_vertices = [
-                Vector3(-ground_size, 0, -ground_size),
-                Vector3(ground_size, 0, -ground_size),
-                Vector3(ground_size, 0, ground_size),
-                Vector3(-ground_size, 0, ground_size)
-            ]
-            
-            proj_ground = []
-            for v in ground_vertices:
-                proj = self.project_to_screen(v, self.camera)
-                if proj[2] > 0.1:
-                    proj_ground.append((proj[0], proj[1]))
-            
-            if len(proj_ground) >= 4:
-                Mesh(
-                    vertices=[
-                        proj_ground[0][0], proj_ground[0][1], 0, 0,
-                        proj_ground[1][0], proj_ground[1][1], 0, 0,
-                        proj_ground[2][0], proj_ground[2][1], 0, 0,
-                        proj_ground[3][0], proj_ground[3][1], 0, 0
-                    ],
-                    indices=[0, 1, 2, 0, 2, 3],
-                    mode='triangles'
-                )
-            
-            # Рисуем пол второго этажа
-            Color(0.35, 0.35, 0.35, 1)
-            second_floor_vertices = [
-                Vector3(-ground_size, self.floor_height, -ground_size),
-                Vector3(ground_size, self.floor_height, -ground_size),
-                Vector3(ground_size, self.floor_height, ground_size),
-                Vector3(-ground_size, self.floor_height, ground_size)
-            ]
-            
-            proj_second_floor = []
-            for v in second_floor_vertices:
-                proj = self.project_to_screen(v, self.camera)
-                if proj[2] > 0.1:
-                    proj_second_floor.append((proj[0], proj[1]))
-            
-            if len(proj_second_floor) >= 4:
-                Mesh(
-                    vertices=[
-                        proj_second_floor[0][0], proj_second_floor[0][1], 0, 0,
-                        proj_second_floor[1][0], proj_second_floor[1][1], 0, 0,
-                        proj_second_floor[2][0], proj_second_floor[2][1], 0, 0,
-                        proj_second_floor[3][0], proj_second_floor[3][1], 0, 0
-                    ],
-                    indices=[0, 1, 2, 0, 2, 3],
-                    mode='triangles'
-                )
-            
-            # Рисуем сетку пола
-            Color(0.4, 0.4, 0.4, 0.5)
-            for line in self.floor_lines:
-                p1 = line[0]
-                p2 = line[1]
-                
-                proj1 = self.project_to_screen(p1, self.camera)
-                proj2 = self.project_to_screen(p2, self.camera)
-                
-                if proj1[2] > 0.1 and proj2[2] > 0.1:
-                    Line(points=[proj1[0], proj1[1], proj2[0], proj2[1]], width=1)
-            
-            # Рисуем стены первого этажа
-            for wall in self.walls_first_floor:
-                self.draw_wall(wall, self.camera)
+        # Инструкции canvas созданы в setup_layers, здесь меняются только их данные
+        self.background_rect.size = (self.width, self.height)
+        
+        # Поворот камеры переводится в преобразование вида один раз на кадр
+        view = ViewTransform(self.camera, self.width, self.height, self.focal)
+        self.view = view
+        
+        # Рисуем пол первого и второго этажа
+        self.draw_floor(self.ground_mesh, 0, view)
+        self.draw_floor(self.second_floor_mesh, self.floor_height, view)
+        
+        # Рисуем сетку пола: все концы линий проецируются одним проходом,
+        # видимые отрезки уходят в один буфер
+        sx, sy, depth = view.project(self.floor_line_points)
+        front = (depth[0::2] > 0.1) & (depth[1::2] > 0.1)
+        screen = np.stack((sx, sy), axis=1).reshape(-1, 2, 2)
+        self.floor_line_batch.clear()
+        self.floor_line_batch.add_lines(screen[front], self.floor_line_colors[front])
+        self.floor_line_batch.commit()
+        
+        # Стены и лестница собираются в один буфер вершин
+        self.world_batch.clear()
+        
+        # Рисуем стены: лучами по сетке или гранями лабиринта
+        if self.render_mode == 'raycast' and self.draw_raycast(view):
+            # Ступени, за которыми во всех их полосах стоят более близкие стены, не видны
+            self.draw_staircase(self.staircase, view, hidden=self.is_hidden_by_strips)
+        else:
+            self.draw_maze(view)
             
-            # Рисуем стены второго этажа
-            for wall in self.walls_second_floor:
-                self.draw_wall(wall, self.camera)
+            # Рисуем лестницу, если ее не закрывают стены
+            if not self.is_box_occluded(self.staircase.get_bounding_box(), view):
+                self.draw_staircase(self.staircase, view)
+        
+        self.world_batch.commit()
+        
+        # Отладочный слой пересобирается только пока есть столкновения
+        if self.collision_count > 0:
+            self.debug_layer.clear()
+            self.debug_visible = True
             
-            # Рисуем лестницу
-            self.draw_staircase(self.staircase, self.camera)
+            # Отладочная отрисовка коллизий стен рядом с игроком
+            position = self.camera.position
+            radius = self.camera.radius
+            nearby = []
+            for wall_grid in (self.wall_grid_first, self.wall_grid_second):
+                nearby += wall_grid.query(position.x - radius, position.z - radius,
+                                          position.x + radius, position.z + radius)
+            for wall in nearby:
+                # Проверяем, сталкивается ли игрок с этой стеной
+                if wall.is_player_colliding(self.camera.position, self.camera.radius, self.camera.height):
+                    self.debug_layer.add(Color(1.0, 0.0, 0.0, 0.3))
+                    wall_bb = wall.get_bounding_box()
+                    self.draw_bounding_box(wall_bb, view)
             
             # Отладочная отрисовка коллизий игрока
-            if self.collision_count > 0:
-                Color(1.0, 0.2, 0.2, 0.3)
-                player_bb = self.camera.get_bounding_box()
-                self.draw_bounding_box(player_bb, self.camera)
+            self.debug_layer.add(Color(1.0, 0.2, 0.2, 0.3))
+            player_bb = self.camera.get_bounding_box()
+            self.draw_bounding_box(player_bb, view)
+        elif self.debug_visible:
+            self.debug_layer.clear()
+            self.debug_visible = False
     
-    def draw_bounding_box(self, bbox, camera):
+    def draw_bounding_box(self, bbox, view):
         """Отрисовка ограничивающей рамки для отладки"""
-        vertices = [
-            Vector3(bbox.min.x, bbox.min.y, bbox.min.z),
-            Vector3(bbox.max.x, bbox.min.y, bbox.min.z),
-            Vector3(bbox.max.x, bbox.min.y, bbox.max.z),
-            Vector3(bbox.min.x, bbox.min.y, bbox.max.z),
-            Vector3(bbox.min.x, bbox.max.y, bbox.min.z),
-            Vector3(bbox.max.x, bbox.max.y, bbox.min.z),
-            Vector3(bbox.max.x, bbox.max.y, bbox.max.z),
-            Vector3(bbox.min.x, bbox.max.y, bbox.max.z)
-        ]
-        
-        # Проектируем вершины
-        proj_vertices = []
-        for v in vertices:
-            proj = self.project_to_screen(v, camera)
-            if proj[2] > 0.1:
-                proj_vertices.append((proj[0], proj[1]))
-            else:
-                return
-        
-        if len(proj_vertices) < 8:
+        vertices = np.array([
+            (bbox.min.x, bbox.min.y, bbox.min.z),
+            (bbox.max.x, bbox.min.y, bbox.min.z),
+            (bbox.max.x, bbox.min.y, bbox.max.z),
+            (bbox.min.x, bbox.min.y, bbox.max.z),
+            (bbox.min.x, bbox.max.y, bbox.min.z),
+            (bbox.max.x, bbox.max.y, bbox.min.z),
+            (bbox.max.x, bbox.max.y, bbox.max.z),
+            (bbox.min.x, bbox.max.y, bbox.max.z)
+        ], dtype=np.float64)
+        
+        # Проектируем вершины; рамка рисуется, только если она вся перед камерой
+        sx, sy, depth = view.project(vertices)
+        if not (depth > 0.1).all():
             return
+        proj_vertices = list(zip(sx.tolist(), sy.tolist()))
         
         # Рисуем линии рамки
         edges = [
@@ -988,148 +1156,187 @@ class Game3D(Widget):
         ]
         
         for edge in edges:
-            Line(points=[
+            self.debug_layer.add(Line(points=[
                 proj_vertices[edge[0]][0], proj_vertices[edge[0]][1],
                 proj_vertices[edge[1]][0], proj_vertices[edge[1]][1]
-            ], width=1.5)
+            ], width=1.5))
     
-    def draw_staircase(self, staircase, camera):
-        """Отрисовка лестницы"""
-        with self.canvas:
-            steps_vertices = staircase.get_steps_vertices()
-            
-            for step_idx, vertices in enumerate(steps_vertices):
-                step_color = (
-                    staircase.color[0] * (1 - step_idx/staircase.steps * 0.3),
-                    staircase.color[1] * (1 - step_idx/staircase.steps * 0.3),
-                    staircase.color[2],
-                    staircase.color[3]
-                )
-                
-                Color(*step_color)
-                
-                faces = [
-                    [vertices[4], vertices[5], vertices[6], vertices[7]],
-                    [vertices[4], vertices[5], vertices[1], vertices[0]],
-                    [vertices[5], vertices[1], vertices[2], vertices[6]],
-                    [vertices[4], vertices[0], vertices[3], vertices[7]]
-                ]
-                
-                for face in faces:
-                    proj_vertices = []
-                    all_behind = False
-                    
-                    for v in face:
-                        proj = self.project_to_screen(v, camera)
-                        if proj[2] <= 0.1:
-                            all_behind = True
-                            break
-                        proj_vertices.append((proj[0], proj[1]))
-                    
-                    if all_behind or len(proj_vertices) < 4:
-                        continue
-                    
-                    Mesh(
-                        vertices=[
-                            proj_vertices[0][0], proj_vertices[0][1], 0, 0,
-                            proj_vertices[1][0], proj_vertices[1][1], 0, 0,
-                            proj_vertices[2][0], proj_vertices[2][1], 0, 0,
-                            proj_vertices[3][0], proj_vertices[3][1], 0, 0
-                        ],
-                        indices=[0, 1, 2, 0, 2, 3],
-                        mode='triangles'
-                    )
-    
-    def draw_wall(self, wall, camera):
-        """Отрисовка стены лабиринта"""
-        with self.canvas:
-            faces = wall.get_faces()
-            face_colors = [
-                (0.6, 0.6, 0.6, 1),
-                (0.5, 0.5, 0.5, 1),
-                (0.7, 0.7, 0.7, 1),
-                (0.7, 0.7, 0.7, 1),
-                (0.8, 0.8, 0.8, 1),
-                (0.4, 0.4, 0.4, 1),
-            ]
-            
-            faces_to_draw = []
-            
-            for i, face in enumerate(faces):
-                vertices_2d = []
-                avg_z = 0
-                all_behind = False
-                
-                for v in face:
-                    proj = self.project_to_screen(v, camera)
-                    if proj[2] <= 0.1:
-                        all_behind = True
-                        break
-                    vertices_2d.append((proj[0], proj[1]))
-                    avg_z += proj[2]
-                
-                if all_behind:
-                    continue
-                
-                avg_z /= 4
-                
-                faces_to_draw.append({
-                    'vertices': vertices_2d,
-                    'color': face_colors[i],
-                    'z': avg_z
-                })
-            
-            faces_to_draw.sort(key=lambda f: f['z'], reverse=True)
-            
-            for face in faces_to_draw:
-                Color(*face['color'])
-                
-                if len(face['vertices']) >= 4:
-                    Mesh(
-                        vertices=[
-                            face['vertices'][0][0], face['vertices'][0][1], 0, 0,
-                            face['vertices'][1][0], face['vertices'][1][1], 0, 0,
-                            face['vertices'][2][0], face['vertices'][2][1], 0, 0,
-                            face['vertices'][3][0], face['vertices'][3][1], 0, 0
-                        ],
-                        indices=[0, 1, 2, 0, 2, 3],
-                        mode='triangles'
-                    )
-            
-            # Отладочная отрисовка коллизий стен (только при столкновениях)
-            if self.collision_count > 0:
-                # Проверяем, сталкивается ли игрок с этой стеной
-                if wall.is_player_colliding(self.camera.position, self.camera.radius, self.camera.height):
-                    Color(1.0, 0.0, 0.0, 0.3)
-                    wall_bb = wall.get_bounding_box()
-                    self.draw_bounding_box(wall_bb, camera)
+    def draw_staircase(self, staircase, view, hidden=None):
+        """Отрисовка лестницы; hidden(грань, проекция) отбрасывает закрытые грани"""
+        # Вершины всех ступеней проецируются одним проходом, грани берут их по индексам
+        sx, sy, depth = view.project(staircase.vertex_array)
+        screen = np.stack((sx, sy), axis=1)[staircase.face_indices]
+        visible = (depth > 0.1)[staircase.face_indices].all(axis=1)
+        
+        if hidden is not None:
+            for k in np.flatnonzero(visible).tolist():
+                if hidden(staircase.faces[k], screen[k].tolist()):
+                    visible[k] = False
+        
+        # Каждая грань - два треугольника с цветом своей ступени
+        triangles = screen[visible][:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3, 2)
+        self.world_batch.add_triangles(triangles, np.repeat(staircase.face_colors[visible], 2, axis=0))
     
-    def project_to_screen(self, point, camera):
-        """Проекция 3D точки на экран"""
-        dx = point.x - camera.position.x
-        dy = point.y - camera.position.y
-        dz = point.z - camera.position.z
+    def draw_raycast(self, view):
+        """Отрисовка стен этажа камеры полосами лучевого рендера, других этажей - гранями.
+        Возвращает False, если глаз выше стен и нужен обычный рендер
+        """
+        position = view.position
+        floor = self.maze_mesh.floor_of(position.y) or 0
+        layout, base = self.maze_mesh.layouts[floor]
+        if position.y > base + self.wall_height:
+            return False
+        
+        # Стены других этажей видны над полосами и сквозь пол; они рисуются
+        # гранями до полос, а закрытое полосами остается под ними
+        faces = self.maze_mesh.floor_faces
+        self.draw_maze(view, sum(faces) & ~faces[floor])
+        
+        self.raycast_top = base + self.wall_height
+        quads, colors = self.raycaster.cast(position, view.yaw, self.width, floor)
+        self.render_stats['raycast_rays'] = self.raycaster.rays
+        self.render_stats['raycast_strips'] = self.raycaster.strips
+        if len(quads) == 0:
+            return True
         
-        cos_y = math.cos(-camera.rotation.y)
-        sin_y = math.sin(-camera.rotation.y)
-        cos_x = math.cos(-camera.rotation.x)
-        sin_x = math.sin(-camera.rotation.x)
+        # Полосы переводятся в пространство камеры одним проходом
+        points = view.to_camera_array(quads.reshape(-1, 3)).reshape(-1, 4, 3)
+        in_front = np.all(points[:, :, 2] > 0.1, axis=1)
         
-        x = dx * cos_y + dz * sin_y
-        z = -dx * sin_y + dz * cos_y
+        sx, sy, depth = view.project_camera_array(points[in_front].reshape(-1, 3))
+        screen = np.stack((sx, sy), axis=1).reshape(-1, 4, 2)
         
-        y = dy * cos_x - z * sin_x
-        z = dy * sin_x + z * cos_x
+        # Каждая полоса - два треугольника
+        triangles = screen[:, [0, 1, 2, 0, 2, 3]].reshape(-1, 3, 2)
+        self.world_batch.add_triangles(triangles, np.repeat(colors[in_front], 2, axis=0))
         
-        if z > 0.1:
-            factor = 500 / z
-            screen_x = x * factor + self.width / 2
-            screen_y = y * factor + self.height / 2
-        else:
-            screen_x = x * 5000 + self.width / 2
-            screen_y = y * 5000 + self.height / 2
+        # Полосы, задевающие ближнюю плоскость (при сильном наклоне взгляда), отсекаются по одной
+        for strip, color in zip(points[~in_front], colors[~in_front]):
+            polygon = self.clip_near([tuple(p) for p in strip])
+            if len(polygon) >= 3:
+                self.world_batch.add_polygon([view.project_camera(p)[:2] for p in polygon],
+                                             tuple(color))
+        return True
+    
+    def is_hidden_by_strips(self, face, projected):
+        """Закрыта ли грань полосами стен последнего лучевого кадра"""
+        # Выше стен грань может выглядывать из-за них
+        if max(v.y for v in face) > self.raycast_top:
+            return False
+        
+        # Глубина вдоль взгляда в плоскости пола, как у полос
+        view = self.view
+        depth = min(view.horizontal_depth(v) for v in face)
+        return self.raycaster.is_hidden(min(p[0] for p in projected),
+                                        max(p[0] for p in projected), depth)
+    
+    def draw_maze(self, view, visible=None):
+        """Отрисовка граней лабиринта от дальних к ближним; visible - маска граней"""
+        # Порядок дает BSP-дерево граней, повернутые от камеры грани в него не входят;
+        # по умолчанию рисуются только грани из потенциально видимого множества клетки камеры
+        if visible is None:
+            visible = self.maze_mesh.visible_faces(view.position)
+        candidates = [face for face in self.maze_mesh.back_to_front(view.position)
+                      if visible >> face.source & 1]
+        if not candidates:
+            self.occlusion.begin(self.width, self.height)
+            return
+        
+        # Общие углы граней берутся из решетки лабиринта: каждый нужный угол
+        # переводится в пространство камеры и проецируется один раз за кадр
+        used, inverse = np.unique([face.corners for face in candidates], return_inverse=True)
+        inverse = inverse.reshape(-1, 4)
+        lattice = view.to_camera_array(self.maze_mesh.lattice[used])
+        sx, sy, depth = view.project_camera_array(lattice)
+        self.render_stats['maze_vertices_projected'] = len(used)
+        
+        points = lattice[inverse].tolist()
+        projected = np.stack((sx, sy, depth), axis=1)[inverse].tolist()
+        in_front = (depth[inverse] > 0.1).all(axis=1).tolist()
+        
+        faces = []
+        for face, corners, screen, front in zip(candidates, points, projected, in_front):
+            if not front:
+                # Грани отсекаются ближней плоскостью, поэтому длинные
+                # слитые грани не пропадают, когда часть их за камерой
+                polygon = self.clip_near(corners)
+                if len(polygon) < 3:
+                    continue
+                screen = [view.project_camera(p) for p in polygon]
+            
+            faces.append((face, screen))
         
-        return (screen_x, screen_y, z)
+        # Ближайшие стены растеризуются в грубый буфер глубины, и закрытые
+        # ими грани не попадают в буфер вершин
+        self.occlusion.begin(self.width, self.height)
+        if self.occlusion_culling:
+            faces = self.occlusion_cull(faces)
+        
+        for face, projected in faces:
+            self.world_batch.add_polygon([(x, y) for x, y, z in projected], face.color)
+    
+    def occlusion_cull(self, faces):
+        """Растеризация ближайших стен в буфер перекрытия и проверка граней по нему"""
+        # Глубина -1/z линейна в экранных координатах; меньше - ближе
+        walls = sorted((min(z for x, y, z in projected), index)
+                       for index, (face, projected) in enumerate(faces) if face.axis != 1)
+        screen = []
+        depth = []
+        for distance, index in walls[:self.max_occluders]:
+            projected = faces[index][1]
+            for i in range(1, len(projected) - 1):
+                triangle = (projected[0], projected[i], projected[i + 1])
+                screen.append([(x, y) for x, y, z in triangle])
+                depth.append([-1 / z for x, y, z in triangle])
+        if screen:
+            self.occlusion.add_occluders(np.array(screen), np.array(depth))
+        self.occlusion.finish()
+        
+        x0 = [min(p[0] for p in projected) for face, projected in faces]
+        y0 = [min(p[1] for p in projected) for face, projected in faces]
+        x1 = [max(p[0] for p in projected) for face, projected in faces]
+        y1 = [max(p[1] for p in projected) for face, projected in faces]
+        near = [-1 / min(p[2] for p in projected) for face, projected in faces]
+        passed = self.occlusion.test_rects(x0, y0, x1, y1, near)
+        
+        self.render_stats['occlusion_occluders'] = self.occlusion.occluders
+        self.render_stats['occlusion_culled'] = self.occlusion.culled
+        return [item for item, keep in zip(faces, passed) if keep]
+    
+    def is_box_occluded(self, bbox, view):
+        """Закрыта ли рамка перекрывателями текущего кадра"""
+        if not self.occlusion_culling:
+            return False
+        
+        corners = np.array([(x, y, z) for x in (bbox.min.x, bbox.max.x)
+                            for y in (bbox.min.y, bbox.max.y)
+                            for z in (bbox.min.z, bbox.max.z)], dtype=np.float64)
+        sx, sy, depth = view.project(corners)
+        if not (depth > 0.1).all():
+            return False
+        
+        occluded = not self.occlusion.is_visible(sx.min(), sy.min(), sx.max(), sy.max(),
+                                                 -1 / depth.min())
+        self.render_stats['occlusion_objects_culled'] = int(occluded)
+        return occluded
+    
+    def clip_near(self, points, near=0.1):
+        """Отсечение многоугольника в пространстве камеры плоскостью z = near"""
+        result = []
+        count = len(points)
+        
+        for i in range(count):
+            a = points[i]
+            b = points[(i + 1) % count]
+            if a[2] >= near:
+                result.append(a)
+            if (a[2] >= near) != (b[2] >= near):
+                t = (near - a[2]) / (b[2] - a[2])
+                result.append((a[0] + (b[0] - a[0]) * t,
+                               a[1] + (b[1] - a[1]) * t,
+                               near))
+        
+        return result
 
 class TwoFloorMazeApp(App):
     def build(self):
@@ -0,0 +1,384 @@
+import math
+import numpy as np
+
+class Vector3:
+    """3D вектор: операторы создают новый вектор, составные (+=, -=, *=, /=) меняют его на месте"""
+    __slots__ = ('x', 'y', 'z')
+    
+    def __init__(self, x=0, y=0, z=0):
+        self.x = x
+        self.y = y
+        self.z = z
+    
+    def __add__(self, other):
+        return Vector3(self.x + other.x, self.y + other.y, self.z + other.z)
+    
+    def __sub__(self, other):
+        return Vector3(self.x - other.x, self.y - other.y, self.z - other.z)
+    
+    def __mul__(self, scalar):
+        return Vector3(self.x * scalar, self.y * scalar, self.z * scalar)
+    
+    def __truediv__(self, scalar):
+        return Vector3(self.x / scalar, self.y / scalar, self.z / scalar)
+    
+    def __neg__(self):
+        return Vector3(-self.x, -self.y, -self.z)
+    
+    def __iadd__(self, other):
+        self.x += other.x
+        self.y += other.y
+        self.z += other.z
+        return self
+    
+    def __isub__(self, other):
+        self.x -= other.x
+        self.y -= other.y
+        self.z -= other.z
+        return self
+    
+    def __imul__(self, scalar):
+        self.x *= scalar
+        self.y *= scalar
+        self.z *= scalar
+        return self
+    
+    def __itruediv__(self, scalar):
+        self.x /= scalar
+        self.y /= scalar
+        self.z /= scalar
+        return self
+    
+    def set(self, x, y, z):
+        """Запись координат на месте"""
+        self.x = x
+        self.y = y
+        self.z = z
+        return self
+    
+    def add_scaled(self, other, scalar):
+        """self += other * scalar без промежуточного вектора"""
+        self.x += other.x * scalar
+        self.y += other.y * scalar
+        self.z += other.z * scalar
+        return self
+    
+    def dot(self, other):
+        """Скалярное произведение"""
+        return self.x * other.x + self.y * other.y + self.z * other.z
+    
+    def cross(self, other):
+        """Векторное произведение"""
+        return Vector3(
+            self.y * other.z - self.z * other.y,
+            self.z * other.x - self.x * other.z,
+            self.x * other.y - self.y * other.x
+        )
+    
+    def length(self):
+        """Длина вектора"""
+        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
+    
+    def normalize(self):
+        """Нормализация"""
+        l = self.length()
+        if l > 0:
+            return Vector3(self.x/l, self.y/l, self.z/l)
+        return Vector3(0, 0, 0)
+    
+    def normalize_ip(self):
+        """Нормализация на месте"""
+        l = self.length()
+        if l > 0:
+            self.x /= l
+            self.y /= l
+            self.z /= l
+        else:
+            self.x = self.y = self.z = 0
+        return self
+    
+    def rotate_x(self, angle):
+        """Вращение вокруг оси X"""
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        y = self.y * cos_a - self.z * sin_a
+        z = self.y * sin_a + self.z * cos_a
+        return Vector3(self.x, y, z)
+    
+    def rotate_y(self, angle):
+        """Вращение вокруг оси Y"""
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        x = self.x * cos_a + self.z * sin_a
+        z = -self.x * sin_a + self.z * cos_a
+        return Vector3(x, self.y, z)
+    
+    def rotate_z(self, angle):
+        """Вращение вокруг оси Z"""
+        cos_a = math.cos(angle)
+        sin_a = math.sin(angle)
+        x = self.x * cos_a - self.y * sin_a
+        y = self.x * sin_a + self.y * cos_a
+        return Vector3(x, y, self.z)
+    
+    def distance_to(self, other):
+        """Расстояние до другой точки"""
+        dx = self.x - other.x
+        dy = self.y - other.y
+        dz = self.z - other.z
+        return math.sqrt(dx*dx + dy*dy + dz*dz)
+    
+    distance = distance_to
+    
+    def distance2d(self, other):
+        """Расстояние только по XZ плоскости"""
+        dx = self.x - other.x
+        dz = self.z - other.z
+        return math.sqrt(dx*dx + dz*dz)
+    
+    def to_tuple(self):
+        return (self.x, self.y, self.z)
+    
+    def copy(self):
+        return Vector3(self.x, self.y, self.z)
+    
+    __copy__ = copy
+    
+    def __repr__(self):
+        return f'Vector3({self.x}, {self.y}, {self.z})'
+
+class Vector3Array:
+    """Массив векторов на numpy (n, 3) с операциями Vector3 для всех элементов разом"""
+    __slots__ = ('data',)
+    
+    def __init__(self, data):
+        self.data = np.asarray(data, dtype=np.float64).reshape(-1, 3)
+    
+    @staticmethod
+    def from_vectors(vectors):
+        """Упаковка последовательности Vector3"""
+        return Vector3Array([v.to_tuple() for v in vectors])
+    
+    @staticmethod
+    def _operand(other):
+        """Vector3 превращается в строку (3,), массив векторов - в (n, 3)"""
+        if isinstance(other, Vector3):
+            return np.array(other.to_tuple())
+        if isinstance(other, Vector3Array):
+            return other.data
+        return other
+    
+    def __len__(self):
+        return len(self.data)
+    
+    def __getitem__(self, index):
+        if isinstance(index, int):
+            return Vector3(*self.data[index].tolist())
+        return Vector3Array(self.data[index])
+    
+    def __add__(self, other):
+        return Vector3Array(self.data + self._operand(other))
+    
+    def __sub__(self, other):
+        return Vector3Array(self.data - self._operand(other))
+    
+    def __mul__(self, scalar):
+        return Vector3Array(self.data * self._operand(scalar))
+    
+    def __iadd__(self, other):
+        self.data += self._operand(other)
+        return self
+    
+    def __isub__(self, other):
+        self.data -= self._operand(other)
+        return self
+    
+    def __imul__(self, scalar):
+        self.data *= self._operand(scalar)
+        return self
+    
+    def dot(self, other):
+        """Скалярные произведения, массив (n,)"""
+        other = self._operand(other)
+        if other.ndim == 1:
+            return self.data @ other
+        return np.einsum('ij,ij->i', self.data, other)
+    
+    def cross(self, other):
+        """Векторные произведения"""
+        return Vector3Array(np.cross(self.data, self._operand(other)))
+    
+    def lengths(self):
+        """Длины векторов, массив (n,)"""
+        return np.sqrt(np.einsum('ij,ij->i', self.data, self.data))
+    
+    def normalize(self):
+        """Нормализация; нулевые векторы остаются нулевыми"""
+        lengths = self.lengths()[:, None]
+        return Vector3Array(np.divide(self.data, lengths, out=np.zeros_like(self.data), where=lengths > 0))
+    
+    def to_vectors(self):
+        """Распаковка в список Vector3"""
+        return [Vector3(x, y, z) for x, y, z in self.data.tolist()]
+
+class Matrix4:
+    """4x4 матрица для 3D преобразований: плоский буфер из 16 чисел по строкам"""
+    __slots__ = ('m',)
+    
+    def __init__(self, matrix=None):
+        if matrix is None:
+            self.m = [1.0, 0.0, 0.0, 0.0,
+                      0.0, 1.0, 0.0, 0.0,
+                      0.0, 0.0, 1.0, 0.0,
+                      0.0, 0.0, 0.0, 1.0]
+        elif len(matrix) == 4:
+            # Совместимость со старым форматом: список из четырех строк
+            self.m = [value for row in matrix for value in row]
+        else:
+            self.m = list(matrix)
+    
+    @property
+    def matrix(self):
+        """Строки матрицы (копия, для совместимости)"""
+        m = self.m
+        return [m[0:4], m[4:8], m[8:12], m[12:16]]
+    
+    def row(self, i):
+        """Строка i в виде списка из 4 чисел"""
+        return self.m[i * 4:i * 4 + 4]
+    
+    def to_array(self):
+        """Матрица в массиве numpy (4, 4)"""
+        return np.array(self.m, dtype=np.float64).reshape(4, 4)
+    
+    @staticmethod
+    def perspective(fov, aspect, near, far):
+        """Матрица перспективной проекции"""
+        f = 1.0 / math.tan(math.radians(fov) / 2.0)
+        return Matrix4([
+            f/aspect, 0, 0, 0,
+            0, f, 0, 0,
+            0, 0, (far+near)/(near-far), (2*far*near)/(near-far),
+            0, 0, -1, 0
+        ])
+    
+    @staticmethod
+    def model(position, rotation, scale):
+        """Матрица модели T * Rz * Ry * Rx * S, собранная в замкнутом виде"""
+        cx, sx = math.cos(rotation.x), math.sin(rotation.x)
+        cy, sy = math.cos(rotation.y), math.sin(rotation.y)
+        cz, sz = math.cos(rotation.z), math.sin(rotation.z)
+        
+        return Matrix4([
+            cz*cy * scale.x, (cz*sy*sx - sz*cx) * scale.y, (cz*sy*cx + sz*sx) * scale.z, position.x,
+            sz*cy * scale.x, (sz*sy*sx + cz*cx) * scale.y, (sz*sy*cx - cz*sx) * scale.z, position.y,
+            -sy * scale.x, cy*sx * scale.y, cy*cx * scale.z, position.z,
+            0, 0, 0, 1
+        ])
+    
+    @staticmethod
+    def look_at(eye, target, up):
+        """Матрица вида (look at)"""
+        z = (eye - target).normalize()
+        x = up.cross(z).normalize()
+        y = z.cross(x)
+        
+        return Matrix4([
+            x.x, x.y, x.z, -x.dot(eye),
+            y.x, y.y, y.z, -y.dot(eye),
+            z.x, z.y, z.z, -z.dot(eye),
+            0, 0, 0, 1
+        ])
+    
+    @staticmethod
+    def compose(*matrices):
+        """Произведение матриц слева направо: compose(A, B, C) = A * B * C"""
+        result = matrices[0]
+        for other in matrices[1:]:
+            result = result.multiply(other)
+        return result
+    
+    def multiply_vector(self, v):
+        """Умножение матрицы на вектор"""
+        m = self.m
+        x = v.x * m[0] + v.y * m[1] + v.z * m[2] + m[3]
+        y = v.x * m[4] + v.y * m[5] + v.z * m[6] + m[7]
+        z = v.x * m[8] + v.y * m[9] + v.z * m[10] + m[11]
+        w = v.x * m[12] + v.y * m[13] + v.z * m[14] + m[15]
+        
+        if w != 0:
+            return Vector3(x/w, y/w, z/w)
+        return Vector3(x, y, z)
+    
+    def transform_points(self, points):
+        """Пакетное умножение матрицы на массив точек формы (n, 3) с делением на w"""
+        if isinstance(points, Vector3Array):
+            return Vector3Array(self.transform_points(points.data))
+        
+        m = self.to_array()
+        result = points @ m[:3, :3].T + m[:3, 3]
+        w = points @ m[3, :3] + m[3, 3]
+        
+        # Как и в multiply_vector: при w == 0 деление не выполняется
+        w = np.where(w != 0, w, 1.0)
+        result /= w[:, None]
+        return result
+    
+    def multiply(self, other):
+        """Умножение матриц"""
+        a = self.m
+        b = other.m
+        result = []
+        for i in range(0, 16, 4):
+            a0, a1, a2, a3 = a[i], a[i + 1], a[i + 2], a[i + 3]
+            result.append(a0 * b[0] + a1 * b[4] + a2 * b[8] + a3 * b[12])
+            result.append(a0 * b[1] + a1 * b[5] + a2 * b[9] + a3 * b[13])
+            result.append(a0 * b[2] + a1 * b[6] + a2 * b[10] + a3 * b[14])
+            result.append(a0 * b[3] + a1 * b[7] + a2 * b[11] + a3 * b[15])
+        return Matrix4(result)
+    
+    def inverse(self):
+        """Обратная матрица через алгебраические дополнения; None для вырожденной"""
+        m = self.m
+        
+        # Миноры 2x2 верхней и нижней пар строк
+        s0 = m[0] * m[5] - m[4] * m[1]
+        s1 = m[0] * m[6] - m[4] * m[2]
+        s2 = m[0] * m[7] - m[4] * m[3]
+        s3 = m[1] * m[6] - m[5] * m[2]
+        s4 = m[1] * m[7] - m[5] * m[3]
+        s5 = m[2] * m[7] - m[6] * m[3]
+        
+        c5 = m[10] * m[15] - m[14] * m[11]
+        c4 = m[9] * m[15] - m[13] * m[11]
+        c3 = m[9] * m[14] - m[13] * m[10]
+        c2 = m[8] * m[15] - m[12] * m[11]
+        c1 = m[8] * m[14] - m[12] * m[10]
+        c0 = m[8] * m[13] - m[12] * m[9]
+        
+        det = s0 * c5 - s1 * c4 + s2 * c3 + s3 * c2 - s4 * c1 + s5 * c0
+        if det == 0:
+            return None
+        k = 1.0 / det
+        
+        return Matrix4([
+            (m[5] * c5 - m[6] * c4 + m[7] * c3) * k,
+            (-m[1] * c5 + m[2] * c4 - m[3] * c3) * k,
+            (m[13] * s5 - m[14] * s4 + m[15] * s3) * k,
+            (-m[9] * s5 + m[10] * s4 - m[11] * s3) * k,
+            
+            (-m[4] * c5 + m[6] * c2 - m[7] * c1) * k,
+            (m[0] * c5 - m[2] * c2 + m[3] * c1) * k,
+            (-m[12] * s5 + m[14] * s2 - m[15] * s1) * k,
+            (m[8] * s5 - m[10] * s2 + m[11] * s1) * k,
+            
+            (m[4] * c4 - m[5] * c2 + m[7] * c0) * k,
+            (-m[0] * c4 + m[1] * c2 - m[3] * c0) * k,
+            (m[12] * s4 - m[13] * s2 + m[15] * s0) * k,
+            (-m[8] * s4 + m[9] * s2 - m[11] * s0) * k,
+            
+            (-m[4] * c3 + m[5] * c1 - m[6] * c0) * k,
+            (m[0] * c3 - m[1] * c1 + m[2] * c0) * k,
+            (-m[12] * s3 + m[13] * s1 - m[14] * s0) * k,
+            (m[8] * s3 - m[9] * s1 + m[10] * s0) * k
+        ])
@@ -0,0 +1,453 @@
+import math
+import numpy as np
+from math3d import Vector3
+
+# Нормали и цвета граней коробки в порядке Wall.get_faces:
+# -z, +z, -x, +x, верх, низ
+BOX_NORMALS = [(0, 0, -1), (0, 0, 1), (-1, 0, 0), (1, 0, 0), (0, 1, 0), (0, -1, 0)]
+BOX_COLORS = [
+    (0.6, 0.6, 0.6, 1),
+    (0.5, 0.5, 0.5, 1),
+    (0.7, 0.7, 0.7, 1),
+    (0.7, 0.7, 0.7, 1),
+    (0.8, 0.8, 0.8, 1),
+    (0.4, 0.4, 0.4, 1),
+]
+
+class MazeFace:
+    """Прямоугольная грань статической геометрии, параллельная осям"""
+    __slots__ = ('min', 'max', 'normal', 'color', 'source', 'axis', 'plane', 'vertices', 'points',
+                 'corners')
+    
+    def __init__(self, min_point, max_point, normal, color, source=-1):
+        self.min = tuple(min_point)
+        self.max = tuple(max_point)
+        self.normal = normal
+        self.color = color
+        
+        # Индекс исходной грани в MazeMesh.faces; части после разрезания BSP его сохраняют
+        self.source = source
+        
+        # Ось нормали и координата плоскости грани
+        self.axis = next(i for i in range(3) if normal[i])
+        self.plane = self.min[self.axis]
+        
+        a, b = [i for i in range(3) if i != self.axis]
+        self.vertices = []
+        for u, v in ((0, 0), (1, 0), (1, 1), (0, 1)):
+            corner = list(self.min)
+            corner[a] = (self.min, self.max)[u][a]
+            corner[b] = (self.min, self.max)[v][b]
+            self.vertices.append(Vector3(*corner))
+        
+        # Те же углы кортежами для пакетной проекции
+        self.points = tuple(v.to_tuple() for v in self.vertices)
+        
+        # Индексы углов в общей решетке вершин MazeMesh.lattice
+        self.corners = None
+    
+    def is_facing(self, point):
+        """Повернута ли грань лицевой стороной к точке"""
+        coord = (point.x, point.y, point.z)[self.axis]
+        return (coord - self.plane) * self.normal[self.axis] > 0
+    
+    def split(self, axis, value):
+        """Части грани по обе стороны плоскости axis = value: (ниже, выше) или None"""
+        if self.max[axis] <= value:
+            return self, None
+        if self.min[axis] >= value:
+            return None, self
+        
+        low_max = list(self.max)
+        low_max[axis] = value
+        high_min = list(self.min)
+        high_min[axis] = value
+        return (MazeFace(self.min, low_max, self.normal, self.color, self.source),
+                MazeFace(high_min, self.max, self.normal, self.color, self.source))
+
+class MazeBSP:
+    """BSP-дерево граней по их плоскостям: обход дает порядок от дальних
+    к ближним без сортировки, в том числе для длинных слитых граней
+    """
+    __slots__ = ('axis', 'plane', 'faces', 'below', 'above')
+    
+    def __init__(self, faces):
+        # Разделитель - плоскость, которая режет меньше всего граней
+        # и делит остальные поровну
+        best = None
+        for axis, plane in {(face.axis, face.plane) for face in faces}:
+            below = above = splits = 0
+            for face in faces:
+                if face.axis == axis and face.plane == plane:
+                    continue
+                if face.max[axis] <= plane:
+                    below += 1
+                elif face.min[axis] >= plane:
+                    above += 1
+                else:
+                    splits += 1
+            score = (splits * 4 + abs(below - above), axis, plane)
+            if best is None or score < best:
+                best = score
+        
+        _, self.axis, self.plane = best
+        self.faces = []
+        below = []
+        above = []
+        for face in faces:
+            if face.axis == self.axis and face.plane == self.plane:
+                self.faces.append(face)
+                continue
+            low, high = face.split(self.axis, self.plane)
+            if low is not None:
+                below.append(low)
+            if high is not None:
+                above.append(high)
+        
+        self.below = MazeBSP(below) if below else None
+        self.above = MazeBSP(above) if above else None
+    
+    def count(self):
+        """Число граней в дереве после разрезания"""
+        return (len(self.faces) + (self.below.count() if self.below else 0) +
+                (self.above.count() if self.above else 0))
+    
+    def collect(self, out):
+        """Все грани дерева после разрезания"""
+        out.extend(self.faces)
+        if self.below is not None:
+            self.below.collect(out)
+        if self.above is not None:
+            self.above.collect(out)
+        return out
+    
+    def back_to_front(self, point, out):
+        """Лицевые к точке грани в порядке от дальних к ближним"""
+        if (point.x, point.y, point.z)[self.axis] > self.plane:
+            far, near = self.below, self.above
+        else:
+            far, near = self.above, self.below
+        
+        if far is not None:
+            far.back_to_front(point, out)
+        # Грани, повернутые от точки, закрыты лицевыми гранями того же тела
+        for face in self.faces:
+            if face.is_facing(point):
+                out.append(face)
+        if near is not None:
+            near.back_to_front(point, out)
+        return out
+
+class MazeMesh:
+    """Статическая сетка лабиринта: список граней вместо коробок-стен.
+    
+    Этажи задаются клеточными раскладками (1 - стена). Грани между соседними
+    стенами, нижние грани на земле или на стене этажа ниже и верхние грани
+    под стеной следующего этажа не создаются, а соседние грани одной плоскости и цвета сливаются
+    в один прямоугольник, поэтому число граней зависит от видимой поверхности,
+    а не от числа стен.
+    
+    Для свободных клеток заранее строятся потенциально видимые множества
+    граней (PVS) в виде битовых масок; клетки с одинаковым множеством
+    образуют одну область. Грани других этажей добавляются к множеству целиком
+    """
+    def __init__(self, maze_size, cell_size, wall_height):
+        self.maze_size = maze_size
+        self.cell_size = cell_size
+        self.wall_height = wall_height
+        self.faces = []
+        self.tree = None
+        
+        # Уникальные углы граней дерева (m, 3): соседние грани ссылаются
+        # на общие углы, и каждый угол проецируется за кадр не больше раза
+        self.lattice = None
+        
+        # Этажи (раскладка, высота основания), грань каждой открытой стороны
+        # клетки-стены по ключу (этаж, i, j, сторона) и маски всех граней этажей
+        self.layouts = []
+        self.cell_faces = {}
+        self.floor_faces = []
+        
+        # Отдельные коробки: (этаж, минимум, максимум, маска граней)
+        self.boxes = []
+        
+        # PVS: маски областей и номер области для (этаж, i, j)
+        self.pvs_sets = []
+        self.pvs_region = {}
+    
+    def edge(self, index):
+        """Координата границы перед клеткой index (по x или z)"""
+        return (index - self.maze_size / 2 - 0.5) * self.cell_size
+    
+    def cell_of(self, x, z):
+        """Клетка (i, j), в которой лежит точка"""
+        offset = self.maze_size / 2 + 0.5
+        return (math.floor(x / self.cell_size + offset),
+                math.floor(z / self.cell_size + offset))
+    
+    def floor_of(self, y):
+        """Этаж, над полом которого находится высота y, или None"""
+        floor = None
+        for index, (layout, base) in enumerate(self.layouts):
+            if base < y:
+                floor = index
+        return floor
+    
+    def add_face(self, min_point, max_point, side, floor=0):
+        """Добавление грани с нормалью и цветом стороны коробки side; возвращает ее индекс"""
+        index = len(self.faces)
+        self.faces.append(MazeFace(min_point, max_point, BOX_NORMALS[side], BOX_COLORS[side], index))
+        while len(self.floor_faces) <= floor:
+            self.floor_faces.append(0)
+        self.floor_faces[floor] |= 1 << index
+        self.tree = None
+        self.lattice = None
+        return index
+    
+    def build(self, layouts):
+        """Построение граней по этажам: список (раскладка, высота основания)"""
+        n = self.maze_size
+        edge = self.edge
+        self.layouts = list(layouts)
+        
+        for floor, (layout, base) in enumerate(layouts):
+            def wall(i, j):
+                return 0 <= i < n and 0 <= j < n and layout[i][j] == 1
+            
+            top = base + self.wall_height
+            
+            # Боковые грани: видна только сторона, за которой нет стены;
+            # открытые грани одной плоскости сливаются в полосы
+            for i in range(n):
+                for side, di in ((2, -1), (3, 1)):
+                    x = edge(i if di < 0 else i + 1)
+                    row = [wall(i, j) and not wall(i + di, j) for j in range(n)]
+                    for _, j0, _, j1 in greedy_rectangles([row]):
+                        index = self.add_face((x, base, edge(j0)), (x, top, edge(j1 + 1)), side, floor)
+                        for j in range(j0, j1 + 1):
+                            self.cell_faces[(floor, i, j, side)] = index
+            
+            for j in range(n):
+                for side, dj in ((0, -1), (1, 1)):
+                    z = edge(j if dj < 0 else j + 1)
+                    row = [wall(i, j) and not wall(i, j + dj) for i in range(n)]
+                    for _, i0, _, i1 in greedy_rectangles([row]):
+                        index = self.add_face((edge(i0), base, z), (edge(i1 + 1), top, z), side, floor)
+                        for i in range(i0, i1 + 1):
+                            self.cell_faces[(floor, i, j, side)] = index
+            
+            # Верх закрыт, если на нем стоит стена следующего этажа
+            above = layouts[floor + 1] if floor + 1 < len(layouts) else None
+            covered = above is not None and above[1] <= top
+            mask = [[wall(i, j) and not (covered and above[0][i][j] == 1) for j in range(n)]
+                    for i in range(n)]
+            for i0, j0, i1, j1 in greedy_rectangles(mask):
+                self.add_face((edge(i0), top, edge(j0)), (edge(i1 + 1), top, edge(j1 + 1)), 4, floor)
+            
+            # Низ стен нижнего этажа лежит на земле. Пол верхних этажей рисуется
+            # под стенами без буфера глубины и ничего не закрывает, поэтому
+            # низ их стен виден снизу, если его не закрывает стена под ним
+            if floor > 0 and base > 0:
+                below = layouts[floor - 1]
+                supported = below[1] + self.wall_height >= base
+                mask = [[wall(i, j) and not (supported and below[0][i][j] == 1) for j in range(n)]
+                        for i in range(n)]
+                for i0, j0, i1, j1 in greedy_rectangles(mask):
+                    self.add_face((edge(i0), base, edge(j0)), (edge(i1 + 1), base, edge(j1 + 1)), 5, floor)
+        
+        return self.faces
+    
+    def add_box(self, wall):
+        """Отдельная стена-коробка: все грани, кроме нижней"""
+        bb = wall.get_bounding_box()
+        x0, y0, z0 = bb.min.to_tuple()
+        x1, y1, z1 = bb.max.to_tuple()
+        floor = self.floor_of(y0 + 1e-6) or 0
+        
+        mask = 0
+        for corner0, corner1, side in (((x0, y0, z0), (x1, y1, z0), 0),
+                                       ((x0, y0, z1), (x1, y1, z1), 1),
+                                       ((x0, y0, z0), (x0, y1, z1), 2),
+                                       ((x1, y0, z0), (x1, y1, z1), 3),
+                                       ((x0, y1, z0), (x1, y1, z1), 4)):
+            mask |= 1 << self.add_face(corner0, corner1, side, floor)
+        self.boxes.append((floor, (x0, z0), (x1, z1), mask))
+    
+    def build_pvs(self, samples=4, directions=360):
+        """Потенциально видимые множества граней для всех свободных клеток.
+        
+        Из samples x samples точек клетки пускаются directions лучей в плоскости
+        пола; луч идет по сетке (DDA) до первой клетки-стены, и видимой
+        считается грань, через которую он в нее вошел. Отдельные коробки
+        ничего не закрывают: видны все их грани, задетые до стены.
+        Верхние грани в множества не входят - они видны только сверху
+        """
+        n = self.maze_size
+        angles = (np.arange(directions) + 0.5) * (2 * math.pi / directions)
+        ray_x = np.cos(angles)
+        ray_z = np.sin(angles)
+        offsets = (np.arange(samples) + 0.5) / samples
+        regions = {}
+        
+        for floor, (layout, base) in enumerate(self.layouts):
+            walls = np.array(layout) == 1
+            boxes = [box for box in self.boxes if box[0] == floor]
+            
+            for i in range(n):
+                for j in range(n):
+                    if walls[i, j]:
+                        continue
+                    
+                    # Начала лучей в координатах сетки (клетка i занимает [i, i + 1))
+                    gx = np.repeat(i + offsets, samples)
+                    gz = np.tile(j + offsets, samples)
+                    gx = np.repeat(gx, directions)
+                    gz = np.repeat(gz, directions)
+                    dx = np.tile(ray_x, samples * samples)
+                    dz = np.tile(ray_z, samples * samples)
+                    
+                    cells, hit = self.trace_rays(walls, gx, gz, dx, dz)
+                    mask = 0
+                    for code in np.unique(cells[cells >= 0]).tolist():
+                        key = (floor, code // (n * 4), code // 4 % n, code % 4)
+                        mask |= 1 << self.cell_faces[key]
+                    
+                    # Коробки: пересечение луча с рамкой до первой стены (в единицах сетки)
+                    for _, (x0, z0), (x1, z1), box_mask in boxes:
+                        if (mask & box_mask) == box_mask:
+                            continue
+                        bx0, bz0 = self.to_grid(x0, z0)
+                        bx1, bz1 = self.to_grid(x1, z1)
+                        with np.errstate(divide='ignore', invalid='ignore'):
+                            tx0 = (bx0 - gx) / dx
+                            tx1 = (bx1 - gx) / dx
+                            tz0 = (bz0 - gz) / dz
+                            tz1 = (bz1 - gz) / dz
+                        enter = np.maximum(np.minimum(tx0, tx1), np.minimum(tz0, tz1))
+                        leave = np.minimum(np.maximum(tx0, tx1), np.maximum(tz0, tz1))
+                        if np.any((enter <= leave) & (leave > 0) & (enter < hit)):
+                            mask |= box_mask
+                    
+                    # Клетки с одинаковым множеством делят одну область
+                    if mask not in regions:
+                        regions[mask] = len(self.pvs_sets)
+                        self.pvs_sets.append(mask)
+                    self.pvs_region[(floor, i, j)] = regions[mask]
+    
+    def to_grid(self, x, z):
+        """Мировые координаты в координатах сетки"""
+        offset = self.maze_size / 2 + 0.5
+        return x / self.cell_size + offset, z / self.cell_size + offset
+    
+    def trace_rays(self, walls, gx, gz, dx, dz):
+        """Пакетный обход сетки лучами: код (i * n + j) * 4 + сторона первой
+        клетки-стены (-1, если луч ушел за сетку) и расстояние до нее
+        """
+        n = self.maze_size
+        count = len(gx)
+        ix = np.floor(gx).astype(np.int64)
+        iz = np.floor(gz).astype(np.int64)
+        step_x = np.where(dx > 0, 1, -1)
+        step_z = np.where(dz > 0, 1, -1)
+        
+        with np.errstate(divide='ignore'):
+            delta_x = np.abs(1 / dx)
+            delta_z = np.abs(1 / dz)
+        next_x = np.where(dx > 0, ix + 1 - gx, gx - ix) * delta_x
+        next_z = np.where(dz > 0, iz + 1 - gz, gz - iz) * delta_z
+        
+        cells = np.full(count, -1, dtype=np.int64)
+        hit = np.full(count, np.inf)
+        active = np.arange(count)
+        
+        while len(active):
+            along_x = next_x[active] < next_z[active]
+            t = np.where(along_x, next_x[active], next_z[active])
+            ix[active] += np.where(along_x, step_x[active], 0)
+            iz[active] += np.where(along_x, 0, step_z[active])
+            next_x[active] += np.where(along_x, delta_x[active], 0)
+            next_z[active] += np.where(along_x, 0, delta_z[active])
+            
+            ci = ix[active]
+            cj = iz[active]
+            inside = (ci >= 0) & (ci < n) & (cj >= 0) & (cj < n)
+            blocked = np.zeros(len(active), dtype=bool)
+            blocked[inside] = walls[ci[inside], cj[inside]]
+            
+            # Сторона клетки, через которую вошел луч: шаг по +x входит в грань -x и т.д.
+            side = np.where(along_x, np.where(step_x[active] > 0, 2, 3),
+                            np.where(step_z[active] > 0, 0, 1))
+            done = active[blocked]
+            cells[done] = ((ci * n + cj) * 4 + side)[blocked]
+            hit[done] = t[blocked]
+            active = active[inside & ~blocked]
+        
+        return cells, hit
+    
+    def visible_faces(self, point):
+        """Маска граней, которые нужно рисовать из точки глаза point"""
+        floor = self.floor_of(point.y)
+        if floor is None:
+            return sum(self.floor_faces)
+        
+        # Пол между этажами рисуется до стен и их не закрывает: стены других
+        # этажей видны над стенами и сквозь пол, их грани рисуются всегда
+        others = sum(self.floor_faces) & ~self.floor_faces[floor]
+        
+        # Над стенами этажа видны и их верхние грани, и все, что за ними
+        layout, base = self.layouts[floor]
+        if point.y > base + self.wall_height:
+            return self.floor_faces[floor] | others
+        
+        i, j = self.cell_of(point.x, point.z)
+        region = self.pvs_region.get((floor, i, j))
+        if region is None:
+            return self.floor_faces[floor] | others
+        return self.pvs_sets[region] | others
+    
+    def back_to_front(self, point):
+        """Лицевые к точке грани от дальних к ближним; дерево строится при первом вызове"""
+        if not self.faces:
+            return []
+        if self.tree is None:
+            self.build_tree()
+        return self.tree.back_to_front(point, [])
+    
+    def build_tree(self):
+        """Построение BSP-дерева и решетки углов его граней"""
+        self.tree = MazeBSP(self.faces)
+        
+        # Углы стен лежат на сетке клеток, поэтому у соседних граней они совпадают
+        index = {}
+        for face in self.tree.collect([]):
+            face.corners = tuple(index.setdefault(point, len(index)) for point in face.points)
+        self.lattice = np.array(list(index), dtype=np.float64).reshape(-1, 3)
+        self.lattice.flags.writeable = False
+
+def greedy_rectangles(mask):
+    """Жадное покрытие клеток маски прямоугольниками (i0, j0, i1, j1) включительно"""
+    rows = len(mask)
+    cols = len(mask[0]) if rows else 0
+    used = [[False] * cols for _ in range(rows)]
+    rectangles = []
+    
+    for i in range(rows):
+        for j in range(cols):
+            if not mask[i][j] or used[i][j]:
+                continue
+            
+            # Сначала тянем прямоугольник вдоль строки, затем вниз на целые строки
+            j1 = j
+            while j1 + 1 < cols and mask[i][j1 + 1] and not used[i][j1 + 1]:
+                j1 += 1
+            i1 = i
+            while i1 + 1 < rows and all(mask[i1 + 1][k] and not used[i1 + 1][k]
+                                        for k in range(j, j1 + 1)):
+                i1 += 1
+            
+            for a in range(i, i1 + 1):
+                for b in range(j, j1 + 1):
+                    used[a][b] = True
+            rectangles.append((i, j, i1, j1))
+    
+    return rectangles
@@ -0,0 +1,89 @@
+import numpy as np
+from rasterizer import ZBufferRasterizer
+
+class OcclusionBuffer:
+    """Грубый буфер глубины для отсечения объектов, закрытых крупными перекрывателями.
+    
+    Каждый кадр ближайшие стены и платформы растеризуются в буфер низкого
+    разрешения, после чего прямоугольник проекции объекта с глубиной его
+    ближайшей точки проверяется по буферу. Глубина может быть любой величиной,
+    линейной в экранных координатах (меньше - ближе), лишь бы одной и той же
+    для перекрывателей и объектов
+    """
+    def __init__(self, width=80, height=60):
+        self.rasterizer = ZBufferRasterizer(width, height)
+        self.width = width
+        self.height = height
+        self.scale = np.ones(2)
+        self.depth = None
+        
+        # Статистика кадра: треугольники перекрывателей, проверенные и отброшенные объекты
+        self.occluders = 0
+        self.tested = 0
+        self.culled = 0
+    
+    def begin(self, screen_width, screen_height):
+        """Очистка буфера перед кадром с экраном заданного размера"""
+        self.rasterizer.clear()
+        self.scale = np.array((self.width / screen_width, self.height / screen_height))
+        self.depth = None
+        self.occluders = 0
+        self.tested = 0
+        self.culled = 0
+    
+    def add_occluders(self, screen, depth):
+        """Растеризация перекрывателей: screen (n, 3, 2) в пикселях экрана, depth (n, 3)"""
+        if len(screen) == 0:
+            return
+        colors = np.ones((len(screen), 4))
+        self.rasterizer.draw_triangles(np.asarray(screen) * self.scale, depth, colors)
+        self.occluders += len(screen)
+    
+    def finish(self):
+        """Консервативная глубина буфера после всех перекрывателей.
+        
+        Пиксель считается закрытым, только если закрыты центры его и всех
+        соседей: берется максимум глубины по окну 3x3. Так края перекрывателей,
+        покрывающие пиксель лишь частично, ничего не отсекают
+        """
+        depth = self.rasterizer.depth.reshape(self.height, self.width)
+        padded = np.pad(depth, 1, constant_values=np.inf)
+        result = depth.copy()
+        for dy in range(3):
+            for dx in range(3):
+                np.maximum(result, padded[dy:dy + self.height, dx:dx + self.width], out=result)
+        self.depth = result
+    
+    def test_rects(self, x0, y0, x1, y1, near):
+        """Проверка прямоугольников экрана (в пикселях) с глубиной ближайшей точки near.
+        Возвращает маску объектов, которые могут быть видны
+        """
+        near = np.asarray(near, dtype=np.float64)
+        visible = np.ones(len(near), dtype=bool)
+        if self.depth is None or self.occluders == 0 or len(near) == 0:
+            return visible
+        
+        sx, sy = self.scale
+        px0 = np.floor(np.asarray(x0) * sx).astype(np.int64)
+        px1 = np.floor(np.asarray(x1) * sx).astype(np.int64)
+        py0 = np.floor(np.asarray(y0) * sy).astype(np.int64)
+        py1 = np.floor(np.asarray(y1) * sy).astype(np.int64)
+        
+        # Часть прямоугольника за краем экрана не видна и не проверяется
+        on_screen = (px1 >= 0) & (px0 < self.width) & (py1 >= 0) & (py0 < self.height)
+        px0 = np.clip(px0, 0, self.width - 1)
+        px1 = np.clip(px1, 0, self.width - 1)
+        py0 = np.clip(py0, 0, self.height - 1)
+        py1 = np.clip(py1, 0, self.height - 1)
+        
+        for k in np.flatnonzero(on_screen).tolist():
+            region = self.depth[py0[k]:py1[k] + 1, px0[k]:px1[k] + 1]
+            visible[k] = region.max() >= near[k]
+        
+        self.tested += len(near)
+        self.culled += len(near) - int(np.count_nonzero(visible))
+        return visible
+    
+    def is_visible(self, x0, y0, x1, y1, near):
+        """Проверка одного прямоугольника"""
+        return bool(self.test_rects([x0], [y0], [x1], [y1], [near])[0])
@@ -0,0 +1,134 @@
+import numpy as np
+
+class ZBufferRasterizer:
+    """Программная растеризация треугольников в буферы цвета и глубины numpy.
+    
+    Все треугольники кадра обрабатываются пакетно: для каждой строки рамки
+    треугольника функции ребер дают отрезок покрытых пикселей, глубина
+    интерполируется по плоскости треугольника, а ближайший фрагмент
+    для каждого пикселя выбирается через minimum.at по буферу глубины.
+    Порядок подачи треугольников не важен.
+    """
+    def __init__(self, width=320, height=240, max_fragments=1 << 20):
+        # Предел фрагментов за один проход ограничивает память
+        self.max_fragments = max_fragments
+        self.resize(width, height)
+    
+    def resize(self, width, height):
+        """Смена внутреннего разрешения"""
+        self.width = width
+        self.height = height
+        self.color = np.zeros((height, width, 4), dtype=np.uint8)
+        self.depth = np.full(width * height, np.inf, dtype=np.float64)
+        
+        # Статистика последнего кадра: фрагменты внутри треугольников и записи цвета
+        self.fragments = 0
+        self.pixels = 0
+    
+    def clear(self):
+        """Очистка буферов: прозрачный цвет и бесконечная глубина"""
+        self.color[:] = 0
+        self.depth[:] = np.inf
+        self.fragments = 0
+        self.pixels = 0
+    
+    def draw_triangles(self, screen, depth, colors):
+        """Растеризация треугольников: screen (n, 3, 2) в пикселях буфера,
+        depth (n, 3) - глубина вершин, colors (n, 4) - RGBA в диапазоне 0..1
+        """
+        if len(screen) == 0:
+            return
+        
+        xs = screen[:, :, 0]
+        ys = screen[:, :, 1]
+        
+        # Строки рамки в пикселях; центр пикселя (i + 0.5, j + 0.5)
+        y0 = np.maximum(np.ceil(ys.min(axis=1) - 0.5), 0).astype(np.int64)
+        y1 = np.minimum(np.floor(ys.max(axis=1) - 0.5), self.height - 1).astype(np.int64)
+        x_min = xs.min(axis=1)
+        x_max = xs.max(axis=1)
+        
+        # Удвоенная площадь со знаком; вырожденные и невидимые треугольники пропускаются
+        ax, ay = xs[:, 0], ys[:, 0]
+        bx, by = xs[:, 1], ys[:, 1]
+        cx, cy = xs[:, 2], ys[:, 2]
+        area = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+        
+        valid = (y1 >= y0) & (area != 0) & (x_max >= 0.5) & (x_min <= self.width - 0.5)
+        index = np.flatnonzero(valid)
+        if len(index) == 0:
+            return
+        
+        # Функции ребер l = A * x + B * y + C, нормированные на площадь:
+        # внутри треугольника это барицентрические координаты (все >= 0)
+        inv_area = 1.0 / area[index]
+        ax, ay, bx, by, cx, cy = ax[index], ay[index], bx[index], by[index], cx[index], cy[index]
+        a = np.stack(((by - cy), (cy - ay), (ay - by)), axis=1) * inv_area[:, None]
+        b = np.stack(((cx - bx), (ax - cx), (bx - ax)), axis=1) * inv_area[:, None]
+        c = np.stack(((bx * cy - cx * by), (cx * ay - ax * cy), (ax * by - bx * ay)), axis=1) * inv_area[:, None]
+        
+        # Глубина линейна в экранных координатах: z = zx * x + zy * y + zc
+        depth = np.asarray(depth, dtype=np.float64)[index]
+        zx = np.einsum('ij,ij->i', a, depth)
+        zy = np.einsum('ij,ij->i', b, depth)
+        zc = np.einsum('ij,ij->i', c, depth)
+        colors = np.clip(np.asarray(colors)[index] * 255 + 0.5, 0, 255).astype(np.uint8)
+        
+        # Строки всех треугольников
+        y0 = y0[index]
+        rows = y1[index] - y0 + 1
+        row_triangle = np.repeat(np.arange(len(index)), rows)
+        py = y0[row_triangle] + np.arange(len(row_triangle)) - np.repeat(np.cumsum(rows) - rows, rows)
+        fy = py + 0.5
+        
+        # Отрезок строки внутри всех трех полуплоскостей A * x + (B * y + C) >= 0
+        ra = a[row_triangle]
+        rest = b[row_triangle] * fy[:, None] + c[row_triangle]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            bound = -rest / ra
+        left = np.where(ra > 0, bound, -np.inf).max(axis=1)
+        right = np.where(ra < 0, bound, np.inf).min(axis=1)
+        empty = ((ra == 0) & (rest < 0)).any(axis=1)
+        
+        x_start = np.maximum(np.ceil(left - 0.5), 0)
+        x_end = np.minimum(np.floor(right - 0.5), self.width - 1)
+        spans = np.where(empty | (x_end < x_start), 0, x_end - x_start + 1).astype(np.int64)
+        x_start = x_start.astype(np.int64)
+        
+        # Глубина в начале строки без учета x
+        row_depth = zy[row_triangle] * fy + zc[row_triangle]
+        row_zx = zx[row_triangle]
+        row_color = colors[row_triangle]
+        row_pixel = py * self.width
+        
+        # Строки идут пачками, чтобы число фрагментов не превышало предел
+        total = np.cumsum(spans)
+        start = 0
+        while start < len(spans):
+            base = total[start - 1] if start else 0
+            end = int(np.searchsorted(total, base + self.max_fragments, side='right'))
+            end = max(end, start + 1)
+            part = slice(start, end)
+            self._draw_spans(spans[part], x_start[part], row_pixel[part],
+                             row_depth[part], row_zx[part], row_color[part])
+            start = end
+    
+    def _draw_spans(self, spans, x_start, row_pixel, row_depth, row_zx, row_color):
+        """Запись отрезков строк с проверкой глубины"""
+        count = int(spans.sum())
+        if count == 0:
+            return
+        
+        row = np.repeat(np.arange(len(spans)), spans)
+        px = x_start[row] + np.arange(count) - np.repeat(np.cumsum(spans) - spans, spans)
+        z = row_depth[row] + row_zx[row] * (px + 0.5)
+        pixel = row_pixel[row] + px
+        self.fragments += count
+        
+        # Ближайший фрагмент пикселя определяется буфером глубины; при равной
+        # глубине остается последний записанный
+        np.minimum.at(self.depth, pixel, z)
+        nearest = z == self.depth[pixel]
+        pixel = pixel[nearest]
+        self.color.reshape(-1, 4)[pixel] = row_color[row[nearest]]
+        self.pixels += len(pixel)
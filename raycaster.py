@@ -0,0 +1,135 @@
+import math
+import numpy as np
+from maze_mesh import BOX_COLORS
+
+class GridRaycaster:
+    """Рендер лабиринта лучами: один луч на полосу экрана шириной column_step.
+    
+    Луч идет по клеткам раскладки этажа (DDA) до первой стены и проверяется
+    с рамками отдельных коробок. Каждая полоса - кусок плоскости попавшей
+    грани между лучами по краям полосы, от пола до верха стен, поэтому работа
+    кадра зависит от ширины экрана, а не от числа стен
+    """
+    def __init__(self, maze_mesh, focal, column_step=4, fog_distance=50, min_shade=0.25):
+        """focal - фокусное расстояние проекции кадра в пикселях"""
+        self.maze = maze_mesh
+        self.column_step = column_step
+        self.focal = focal
+        
+        # Затенение по расстоянию: линейно до min_shade на fog_distance
+        self.fog_distance = fog_distance
+        self.min_shade = min_shade
+        
+        # Глубина стены по каждой полосе последнего кадра (вдоль взгляда
+        # в плоскости пола, inf - луч ничего не встретил) и статистика
+        self.depth = np.empty(0)
+        self.rays = 0
+        self.strips = 0
+    
+    def cast(self, position, yaw, width, floor):
+        """Полосы стен для камеры в точке position с поворотом yaw.
+        Возвращает углы полос в мире (n, 4, 3) и их цвета (n, 4)
+        """
+        maze = self.maze
+        layout, base = maze.layouts[floor]
+        walls = np.array(layout) == 1
+        cell = maze.cell_size
+        
+        # Края полос по экрану и центры полос; направления лучей в плоскости
+        # пола через горизонтальную координату камеры (x - width / 2) / focal
+        count = max(1, int(math.ceil(width / self.column_step)))
+        edges = np.minimum(np.arange(count + 1) * self.column_step, width)
+        centers = (edges[:-1] + edges[1:]) / 2
+        edge_dx, edge_dz = self.directions(edges, yaw, width)
+        ray_dx, ray_dz = self.directions(centers, yaw, width)
+        
+        gx, gz = maze.to_grid(position.x, position.z)
+        cells, hit = maze.trace_rays(walls, np.full(count, gx), np.full(count, gz), ray_dx, ray_dz)
+        side = np.where(cells >= 0, cells % 4, -1)
+        
+        # Плоскость попавшей грани: ось (0 - x, 1 - z) и координата в клетках сетки
+        along_x = (side == 2) | (side == 3)
+        with np.errstate(invalid='ignore'):
+            plane = np.where(along_x, gx + hit * ray_dx, gz + hit * ray_dz)
+        
+        # Отдельные коробки этажа закрывают стены, если луч входит в них раньше
+        for box_floor, (x0, z0), (x1, z1), mask in maze.boxes:
+            if box_floor != floor:
+                continue
+            bx0, bz0 = maze.to_grid(x0, z0)
+            bx1, bz1 = maze.to_grid(x1, z1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                tx = np.minimum((bx0 - gx) / ray_dx, (bx1 - gx) / ray_dx)
+                tz = np.minimum((bz0 - gz) / ray_dz, (bz1 - gz) / ray_dz)
+                leave = np.minimum(np.maximum((bx0 - gx) / ray_dx, (bx1 - gx) / ray_dx),
+                                   np.maximum((bz0 - gz) / ray_dz, (bz1 - gz) / ray_dz))
+            enter = np.maximum(tx, tz)
+            closer = (enter <= leave) & (enter > 0) & (enter < hit)
+            if not closer.any():
+                continue
+            
+            # Луч входит в грань той оси, по которой вход позже
+            enter_x = tx >= tz
+            hit = np.where(closer, enter, hit)
+            along_x = np.where(closer, enter_x, along_x)
+            side = np.where(closer, np.where(enter_x, np.where(ray_dx > 0, 2, 3),
+                                             np.where(ray_dz > 0, 0, 1)), side)
+            plane = np.where(closer, np.where(enter_x, np.where(ray_dx > 0, bx0, bx1),
+                                              np.where(ray_dz > 0, bz0, bz1)), plane)
+        
+        valid = np.isfinite(hit) & (side >= 0)
+        index = np.flatnonzero(valid)
+        forward = self.focal / np.sqrt((centers - width / 2) ** 2 + self.focal ** 2)
+        self.depth = np.where(valid, hit * cell * forward, np.inf)
+        self.rays = count
+        self.strips = len(index)
+        if len(index) == 0:
+            return np.empty((0, 4, 3)), np.empty((0, 4))
+        
+        # Пересечение лучей по краям полосы с плоскостью грани
+        corners = []
+        for edge in (index, index + 1):
+            d_along = np.where(along_x[index], edge_dx[edge], edge_dz[edge])
+            origin = np.where(along_x[index], gx, gz)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                t = (plane[index] - origin) / d_along
+            # Луч края, почти параллельный грани, заменяется центральным
+            t = np.where(np.isfinite(t) & (t > 0) & (t < hit[index] * 4), t, hit[index])
+            corners.append((gx + t * edge_dx[edge], gz + t * edge_dz[edge]))
+        
+        offset = maze.maze_size / 2 + 0.5
+        top = base + maze.wall_height
+        quads = np.empty((len(index), 4, 3))
+        for k, (cx, cz) in enumerate((corners[0], corners[1], corners[1], corners[0])):
+            quads[:, k, 0] = (cx - offset) * cell
+            quads[:, k, 1] = base if k < 2 else top
+            quads[:, k, 2] = (cz - offset) * cell
+        
+        # Цвет стороны грани, темнее с расстоянием
+        distance = hit[index] * cell
+        shade = np.clip(1 - distance / self.fog_distance, self.min_shade, 1)
+        colors = np.array(BOX_COLORS, dtype=np.float64)[side[index]]
+        colors[:, :3] *= shade[:, None]
+        return quads, colors
+    
+    def is_hidden(self, x0, x1, depth):
+        """Закрыт ли стенами объект на экране от x0 до x1 с ближайшей глубиной depth"""
+        if len(self.depth) == 0:
+            return False
+        k0 = max(0, int(x0 // self.column_step))
+        k1 = min(len(self.depth) - 1, int(x1 // self.column_step))
+        if k0 > k1:
+            return False
+        return bool(np.all(self.depth[k0:k1 + 1] < depth))
+    
+    def directions(self, columns, yaw, width):
+        """Единичные направления лучей в плоскости пола для колонок экрана"""
+        x = (columns - width / 2) / self.focal
+        length = np.sqrt(x * x + 1)
+        x = x / length
+        z = 1 / length
+        
+        # Обратный к ViewTransform.to_camera поворот по рысканью
+        cos_y = math.cos(yaw)
+        sin_y = math.sin(yaw)
+        return x * cos_y + z * sin_y, -x * sin_y + z * cos_y
@@ -0,0 +1,212 @@
+import numpy as np
+from kivy.graphics import Mesh, Color, RenderContext
+
+# Шейдер с цветом на вершину: стандартный шейдер Kivy берет цвет
+# только из инструкции Color, поэтому для одного Mesh на кадр нужен свой
+VERTEX_SHADER = '''
+$HEADER$
+attribute vec4 vColor;
+
+void main (void) {
+  frag_color = vColor;
+  tex_coord0 = vec2(0.0, 0.0);
+  gl_Position = projection_mat * modelview_mat * vec4(vPosition.xy, 0.0, 1.0);
+}
+'''
+
+FRAGMENT_SHADER = '''
+$HEADER$
+
+void main (void) {
+  gl_FragColor = frag_color;
+}
+'''
+
+# Формат вершины: позиция на экране + RGBA
+VERTEX_FORMAT = [(b'vPosition', 2, 'float'), (b'vColor', 4, 'float')]
+VERTEX_SIZE = 6
+
+# Шейдер текстуры с перспективной коррекцией: вершина несет (s*q, t*q, q),
+# где q = 1/w, и деление выполняется для каждого пикселя
+TEXTURE_VERTEX_SHADER = '''
+$HEADER$
+attribute vec3 vTexCoordsQ;
+varying vec3 tex_coord_q;
+
+void main (void) {
+  frag_color = color;
+  tex_coord0 = vec2(0.0, 0.0);
+  tex_coord_q = vTexCoordsQ;
+  gl_Position = projection_mat * modelview_mat * vec4(vPosition.xy, 0.0, 1.0);
+}
+'''
+
+TEXTURE_FRAGMENT_SHADER = '''
+$HEADER$
+varying vec3 tex_coord_q;
+
+void main (void) {
+  gl_FragColor = frag_color * texture2D(texture0, tex_coord_q.xy / tex_coord_q.z);
+}
+'''
+
+# Формат вершины: позиция на экране + проективные координаты текстуры
+TEXTURE_VERTEX_FORMAT = [(b'vPosition', 2, 'float'), (b'vTexCoordsQ', 3, 'float')]
+
+# Индексы Mesh в Kivy хранятся как unsigned short
+MAX_VERTICES = 65535
+
+class ColorMeshBatch:
+    """Буфер вершин (позиция + цвет) и индексов, отправляемый одним или несколькими Mesh"""
+    def __init__(self, mode='triangles'):
+        self.mode = mode
+        self.meshes = []
+        
+        # Контекст создается один раз; каждый кадр меняются только данные Mesh
+        self.context = RenderContext(use_parent_projection=True,
+                                     use_parent_modelview=True)
+        self.context.shader.vs = VERTEX_SHADER
+        self.context.shader.fs = FRAGMENT_SHADER
+        
+        self.clear()
+    
+    def clear(self):
+        """Очистка буфера перед новым кадром"""
+        # Каждый блок - [вершины, индексы, количество вершин]
+        self.chunks = [[[], [], 0]]
+    
+    def _reserve(self, count):
+        """Возвращает блок, в который поместится count вершин"""
+        chunk = self.chunks[-1]
+        if chunk[2] + count > MAX_VERTICES:
+            chunk = [[], [], 0]
+            self.chunks.append(chunk)
+        return chunk
+    
+    def add_polygon(self, points, color):
+        """Добавление выпуклого многоугольника (веер треугольников)"""
+        count = len(points)
+        if count < 3:
+            return
+        
+        chunk = self._reserve(count)
+        base = chunk[2]
+        r, g, b, a = color
+        
+        for x, y in points:
+            chunk[0].extend((x, y, r, g, b, a))
+        for i in range(1, count - 1):
+            chunk[1].extend((base, base + i, base + i + 1))
+        chunk[2] += count
+    
+    def add_triangles(self, screen, colors):
+        """Добавление массива треугольников: screen (n, 3, 2), colors (n, 4)"""
+        per_chunk = MAX_VERTICES // 3
+        start = 0
+        
+        while start < len(screen):
+            chunk = self.chunks[-1]
+            free = (MAX_VERTICES - chunk[2]) // 3
+            if free == 0:
+                chunk = self._reserve(MAX_VERTICES)
+                free = per_chunk
+            
+            part = slice(start, start + free)
+            count = len(screen[part])
+            
+            data = np.empty((count, 3, VERTEX_SIZE))
+            data[:, :, :2] = screen[part]
+            data[:, :, 2:] = colors[part][:, None, :]
+            
+            chunk[0].extend(data.ravel().tolist())
+            chunk[1].extend(range(chunk[2], chunk[2] + count * 3))
+            chunk[2] += count * 3
+            start += count
+    
+    def add_lines(self, screen, colors):
+        """Добавление отрезков для режима 'lines': screen (n, 2, 2), colors (n, 2, 4)"""
+        per_chunk = MAX_VERTICES // 2
+        start = 0
+        
+        while start < len(screen):
+            chunk = self.chunks[-1]
+            free = (MAX_VERTICES - chunk[2]) // 2
+            if free == 0:
+                chunk = self._reserve(MAX_VERTICES)
+                free = per_chunk
+            
+            part = slice(start, start + free)
+            count = len(screen[part])
+            
+            data = np.empty((count, 2, VERTEX_SIZE))
+            data[:, :, :2] = screen[part]
+            data[:, :, 2:] = colors[part]
+            
+            chunk[0].extend(data.ravel().tolist())
+            chunk[1].extend(range(chunk[2], chunk[2] + count * 2))
+            chunk[2] += count * 2
+            start += count
+    
+    def commit(self):
+        """Перенос буфера в Mesh контекста; новые Mesh создаются только при росте данных"""
+        chunks = [chunk for chunk in self.chunks if chunk[2]]
+        
+        for i, (vertices, indices, count) in enumerate(chunks):
+            if i < len(self.meshes):
+                mesh = self.meshes[i]
+                mesh.vertices = vertices
+                mesh.indices = indices
+            else:
+                mesh = Mesh(vertices=vertices, indices=indices,
+                            fmt=VERTEX_FORMAT, mode=self.mode)
+                self.meshes.append(mesh)
+                self.context.add(mesh)
+        
+        # Лишние Mesh с прошлых кадров остаются в контексте пустыми
+        for mesh in self.meshes[len(chunks):]:
+            mesh.vertices = []
+            mesh.indices = []
+
+class TexturedPolygonBatch:
+    """Текстурированные многоугольники одним Mesh с перспективной коррекцией текстуры"""
+    def __init__(self, texture, color=(1, 1, 1, 1)):
+        self.texture = texture
+        self.mesh = None
+        
+        self.context = RenderContext(use_parent_projection=True,
+                                     use_parent_modelview=True)
+        self.context.shader.vs = TEXTURE_VERTEX_SHADER
+        self.context.shader.fs = TEXTURE_FRAGMENT_SHADER
+        self.context.add(Color(*color))
+        
+        self.clear()
+    
+    def clear(self):
+        """Очистка буфера перед новым кадром"""
+        self.vertices = []
+        self.indices = []
+        self.count = 0
+    
+    def add_polygon(self, points, tex_coords):
+        """Добавление выпуклого многоугольника: точки (x, y) и координаты (s, t, q)"""
+        count = len(points)
+        if count < 3 or self.count + count > MAX_VERTICES:
+            return
+        
+        base = self.count
+        for (x, y), (s, t, q) in zip(points, tex_coords):
+            self.vertices.extend((x, y, s * q, t * q, q))
+        for i in range(1, count - 1):
+            self.indices.extend((base, base + i, base + i + 1))
+        self.count += count
+    
+    def commit(self):
+        """Перенос буфера в Mesh контекста"""
+        if self.mesh is None:
+            self.mesh = Mesh(vertices=self.vertices, indices=self.indices,
+                             fmt=TEXTURE_VERTEX_FORMAT, mode='triangles',
+                             texture=self.texture)
+            self.context.add(self.mesh)
+        else:
+            self.mesh.vertices = self.vertices
+            self.mesh.indices = self.indices
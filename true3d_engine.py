@@ -1,148 +1,26 @@
 import math
+import os
 import random
-from kivy.graphics import Mesh, Color, Rectangle, Line, PushMatrix, PopMatrix, Rotate, Translate, Scale
-from kivy.graphics.transformation import Matrix
+import numpy as np
+from kivy.graphics import Color, Rectangle, Line, Ellipse, InstructionGroup, PushMatrix, PopMatrix, Translate
+from kivy.graphics.texture import Texture
+from kivy.core.image import Image as CoreImage
+from render_batch import ColorMeshBatch, TexturedPolygonBatch
+from math3d import Vector3, Vector3Array, Matrix4
+from rasterizer import ZBufferRasterizer
+from occlusion import OcclusionBuffer
 
-class Vector3:
-    """3D вектор с математическими операциями"""
-    def __init__(self, x=0, y=0, z=0):
-        self.x = x
-        self.y = y
-        self.z = z
-    
-    def __add__(self, other):
-        return Vector3(self.x + other.x, self.y + other.y, self.z + other.z)
-    
-    def __sub__(self, other):
-        return Vector3(self.x - other.x, self.y - other.y, self.z - other.z)
-    
-    def __mul__(self, scalar):
-        return Vector3(self.x * scalar, self.y * scalar, self.z * scalar)
-    
-    def __truediv__(self, scalar):
-        return Vector3(self.x / scalar, self.y / scalar, self.z / scalar)
-    
-    def dot(self, other):
-        """Скалярное произведение"""
-        return self.x * other.x + self.y * other.y + self.z * other.z
-    
-    def cross(self, other):
-        """Векторное произведение"""
-        return Vector3(
-            self.y * other.z - self.z * other.y,
-            self.z * other.x - self.x * other.z,
-            self.x * other.y - self.y * other.x
-        )
-    
-    def length(self):
-        """Длина вектора"""
-        return math.sqrt(self.x*self.x + self.y*self.y + self.z*self.z)
-    
-    def normalize(self):
-        """Нормализация"""
-        l = self.length()
-        if l > 0:
-            return Vector3(self.x/l, self.y/l, self.z/l)
-        return Vector3(0, 0, 0)
-    
-    def rotate_x(self, angle):
-        """Вращение вокруг оси X"""
-        cos_a = math.cos(angle)
-        sin_a = math.sin(angle)
-        y = self.y * cos_a - self.z * sin_a
-        z = self.y * sin_a + self.z * cos_a
-        return Vector3(self.x, y, z)
-    
-    def rotate_y(self, angle):
-        """Вращение вокруг оси Y"""
-        cos_a = math.cos(angle)
-        sin_a = math.sin(angle)
-        x = self.x * cos_a + self.z * sin_a
-        z = -self.x * sin_a + self.z * cos_a
-        return Vector3(x, self.y, z)
-    
-    def rotate_z(self, angle):
-        """Вращение вокруг оси Z"""
-        cos_a = math.cos(angle)
-        sin_a = math.sin(angle)
-        x = self.x * cos_a - self.y * sin_a
-        y = self.x * sin_a + self.y * cos_a
-        return Vector3(x, y, self.z)
-    
-    def distance_to(self, other):
-        """Расстояние до другой точки"""
-        dx = self.x - other.x
-        dy = self.y - other.y
-        dz = self.z - other.z
-        return math.sqrt(dx*dx + dy*dy + dz*dz)
-    
-    def to_tuple(self):
-        return (self.x, self.y, self.z)
-    
-    def copy(self):
-        return Vector3(self.x, self.y, self.z)
+# Текстура пола и размер ее повтора в мировых единицах
+FLOOR_TEXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'floor.png')
+FLOOR_TEXTURE_REPEAT = 4.0
 
-class Matrix4:
-    """4x4 матрица для 3D преобразований"""
-    def __init__(self, matrix=None):
-        if matrix is None:
-            self.matrix = [
-                [1, 0, 0, 0],
-                [0, 1, 0, 0],
-                [0, 0, 1, 0],
-                [0, 0, 0, 1]
-            ]
-        else:
-            self.matrix = matrix
-    
-    @staticmethod
-    def perspective(fov, aspect, near, far):
-        """Матрица перспективной проекции"""
-        f = 1.0 / math.tan(math.radians(fov) / 2.0)
-        return Matrix4([
-            [f/aspect, 0, 0, 0],
-            [0, f, 0, 0],
-            [0, 0, (far+near)/(near-far), (2*far*near)/(near-far)],
-            [0, 0, -1, 0]
-        ])
-    
-    @staticmethod
-    def look_at(eye, target, up):
-        """Матрица вида (look at)"""
-        z = (eye - target).normalize()
-        x = up.cross(z).normalize()
-        y = z.cross(x)
-        
-        return Matrix4([
-            [x.x, x.y, x.z, -x.dot(eye)],
-            [y.x, y.y, y.z, -y.dot(eye)],
-            [z.x, z.y, z.z, -z.dot(eye)],
-            [0, 0, 0, 1]
-        ])
-    
-    def multiply_vector(self, v):
-        """Умножение матрицы на вектор"""
-        x = v.x * self.matrix[0][0] + v.y * self.matrix[0][1] + v.z * self.matrix[0][2] + self.matrix[0][3]
-        y = v.x * self.matrix[1][0] + v.y * self.matrix[1][1] + v.z * self.matrix[1][2] + self.matrix[1][3]
-        z = v.x * self.matrix[2][0] + v.y * self.matrix[2][1] + v.z * self.matrix[2][2] + self.matrix[2][3]
-        w = v.x * self.matrix[3][0] + v.y * self.matrix[3][1] + v.z * self.matrix[3][2] + self.matrix[3][3]
-        
-        if w != 0:
-            return Vector3(x/w, y/w, z/w)
-        return Vector3(x, y, z)
-    
-    def multiply(self, other):
-        """Умножение матриц"""
-        result = [[0]*4 for _ in range(4)]
-        for i in range(4):
-            for j in range(4):
-                result[i][j] = (
-                    self.matrix[i][0] * other.matrix[0][j] +
-                    self.matrix[i][1] * other.matrix[1][j] +
-                    self.matrix[i][2] * other.matrix[2][j] +
-                    self.matrix[i][3] * other.matrix[3][j]
-                )
-        return Matrix4(result)
+# Площадь в квадратных пикселях, ниже которой треугольник считается вырожденным
+DEGENERATE_AREA = 1e-6
+
+# Уровни детализации колонн: число граней от подробного к грубому и минимальный
+# радиус на экране (в пикселях) для всех уровней, кроме последнего
+COLUMN_LOD_SEGMENTS = (16, 8, 4)
+COLUMN_LOD_THRESHOLDS = (40, 10)
 
 class Triangle:
     """Треугольник для полигонального рендеринга"""
@@ -150,10 +28,11 @@ class Triangle:
         self.vertices = [v1, v2, v3]
         self.color = color
         self.normal = None
+        self.center = None
         self.calculate_normal()
     
     def calculate_normal(self):
-        """Вычисление нормали треугольника"""
+        """Вычисление нормали и центра треугольника (один раз при создании)"""
         v1 = self.vertices[0]
         v2 = self.vertices[1]
         v3 = self.vertices[2]
@@ -161,24 +40,137 @@ class Triangle:
         edge1 = v2 - v1
         edge2 = v3 - v1
         self.normal = edge1.cross(edge2).normalize()
+        self.center = (v1 + v2 + v3) / 3
     
     def get_center(self):
         """Центр треугольника"""
-        return (self.vertices[0] + self.vertices[1] + self.vertices[2]) / 3
+        return self.center
     
     def is_facing_camera(self, camera_pos):
         """Проверка, смотрит ли треугольник на камеру"""
-        center = self.get_center()
-        view_dir = (camera_pos - center).normalize()
-        return self.normal.dot(view_dir) < 0
+        # Для знака скалярного произведения нормировать вектор взгляда не нужно;
+        # n * (p - c) = n * p - n * c считается без временного вектора
+        return self.normal.dot(camera_pos) < self.normal.dot(self.center)
 
-class Mesh3D:
-    """3D модель из треугольников"""
-    def __init__(self):
-        self.triangles = []
-        self.position = Vector3(0, 0, 0)
+def pack_triangles(triangles):
+    """Упаковка вершин треугольников в непрерывный массив формы (n * 3, 3)"""
+    return Vector3Array.from_vectors(v for triangle in triangles for v in triangle.vertices).data
+
+def pack_normals(triangles):
+    """Нормали треугольников в массиве формы (n, 3)"""
+    return Vector3Array.from_vectors(t.normal for t in triangles).data
+
+def triangle_normals(corners):
+    """Ненормированные нормали для массива треугольников (n, 3, 3)"""
+    return np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+
+def clip_polygon_near(points, near):
+    """Отсечение многоугольника из точек (x, y, z, w, s, t) в пространстве отсечения по плоскости w >= near"""
+    result = []
+    count = len(points)
+    for i in range(count):
+        a = points[i]
+        b = points[(i + 1) % count]
+        a_inside = a[3] >= near
+        b_inside = b[3] >= near
+        
+        if a_inside:
+            result.append(a)
+        if a_inside != b_inside:
+            t = (near - a[3]) / (b[3] - a[3])
+            result.append(tuple(pa + (pb - pa) * t for pa, pb in zip(a, b)))
+    return result
+
+def ndc_to_screen(ndc, width, height):
+    """Преобразование нормализованных координат в экранные для массива точек"""
+    screen = np.empty((len(ndc), 2))
+    screen[:, 0] = (ndc[:, 0] + 1) * 0.5 * width
+    screen[:, 1] = (1 - ndc[:, 1]) * 0.5 * height
+    return screen
+
+def box_screen_rects(view_projection, box_min, box_max, width, height):
+    """Прямоугольники проекций рамок на экране и глубина их ближайших углов.
+    
+    Возвращает x0, y0, x1, y1, near и маску рамок, все углы которых перед
+    камерой; для остальных прямоугольник не определен
+    """
+    count = len(box_min)
+    bits = np.array([[(k >> axis) & 1 for axis in range(3)] for k in range(8)], dtype=bool)
+    corners = np.where(bits[None, :, :], box_max[:, None, :], box_min[:, None, :])
+    
+    projected = view_projection.transform_points(corners.reshape(-1, 3))
+    z = projected[:, 2].reshape(count, 8)
+    in_front = np.all((z > 0) & (z < 1), axis=1)
+    screen = ndc_to_screen(projected, width, height).reshape(count, 8, 2)
+    
+    return (screen[:, :, 0].min(axis=1), screen[:, :, 1].min(axis=1),
+            screen[:, :, 0].max(axis=1), screen[:, :, 1].max(axis=1),
+            z.min(axis=1), in_front)
+
+class ModelTransform:
+    """Положение, вращение и масштаб модели с кэшированной матрицей модели"""
+    def __init__(self, position=None):
+        self.position = position.copy() if position is not None else Vector3(0, 0, 0)
         self.rotation = Vector3(0, 0, 0)
         self.scale = Vector3(1, 1, 1)
+        
+        # Векторы меняются на месте, поэтому актуальность матрицы
+        # проверяется по ключу из их компонент
+        self._model_key = None
+        self._model_matrix = None
+        self._model_array = None
+    
+    def get_model_matrix(self):
+        """Матрица модели; пересобирается только после изменения преобразования"""
+        p, r, s = self.position, self.rotation, self.scale
+        key = (p.x, p.y, p.z, r.x, r.y, r.z, s.x, s.y, s.z)
+        if key != self._model_key:
+            self._model_key = key
+            self._model_matrix = Matrix4.model(p, r, s)
+            self._model_array = None
+        return self._model_matrix
+    
+    def get_model_array(self):
+        """Матрица модели в массиве numpy (4, 4)"""
+        matrix = self.get_model_matrix()
+        if self._model_array is None:
+            self._model_array = matrix.to_array()
+        return self._model_array
+    
+    def transform_vertex(self, vertex):
+        """Применение преобразований к вершине"""
+        # Последняя строка матрицы модели (0, 0, 0, 1): деления на w нет
+        return self.get_model_matrix().multiply_vector(vertex)
+    
+    def update(self, dt):
+        """Обновление анимации"""
+        self.rotation.y += dt * 1.0
+        self.rotation.x += dt * 0.5
+
+def screen_space_cull(screen, width, height, min_area):
+    """Маски треугольников (n, 3, 2) в пикселях экрана: целиком за краем экрана,
+    вырожденные (нулевой площади) и мельче min_area квадратных пикселей
+    """
+    xs = screen[:, :, 0]
+    ys = screen[:, :, 1]
+    offscreen = ((xs.max(axis=1) < 0) | (xs.min(axis=1) > width) |
+                 (ys.max(axis=1) < 0) | (ys.min(axis=1) > height))
+    
+    area = 0.5 * np.abs((xs[:, 1] - xs[:, 0]) * (ys[:, 2] - ys[:, 0]) -
+                        (ys[:, 1] - ys[:, 0]) * (xs[:, 2] - xs[:, 0]))
+    degenerate = ~offscreen & (area <= DEGENERATE_AREA)
+    tiny = ~offscreen & ~degenerate & (area < min_area)
+    return offscreen, degenerate, tiny
+
+class Mesh3D(ModelTransform):
+    """3D модель: массив уникальных вершин и индексы треугольников"""
+    def __init__(self):
+        super().__init__()
+        self.vertices = []
+        self.indices = []
+        self.colors = []
+        self._triangles = None
+        self._arrays = None
         self.color = [1, 1, 1, 1]
     
     def create_cube(self, size=1):
@@ -216,15 +208,9 @@ class Mesh3D:
             (0, 5, 4, [0.2, 0.8, 0.8, 1])
         ]
         
-        for face in faces:
-            v1_idx, v2_idx, v3_idx, color = face
-            triangle = Triangle(
-                vertices[v1_idx].copy(),
-                vertices[v2_idx].copy(),
-                vertices[v3_idx].copy(),
-                color
-            )
-            self.triangles.append(triangle)
+        self.add_vertices(vertices)
+        for v1_idx, v2_idx, v3_idx, color in faces:
+            self.add_triangle(v1_idx, v2_idx, v3_idx, color)
     
     def create_pyramid(self, height=1, base_size=1):
         """Создание пирамиды"""
@@ -250,15 +236,9 @@ class Mesh3D:
             (3, 0, 4, [1, 0.8, 0, 1])
         ]
         
-        for face in faces:
-            v1_idx, v2_idx, v3_idx, color = face
-            triangle = Triangle(
-                vertices[v1_idx].copy(),
-                vertices[v2_idx].copy(),
-                vertices[v3_idx].copy(),
-                color
-            )
-            self.triangles.append(triangle)
+        self.add_vertices(vertices)
+        for v1_idx, v2_idx, v3_idx, color in faces:
+            self.add_triangle(v1_idx, v2_idx, v3_idx, color)
     
     def create_sphere(self, radius=1, segments=8):
         """Создание сферы (аппроксимация)"""
@@ -276,52 +256,205 @@ class Mesh3D:
                 
                 vertices.append(Vector3(x, y, z))
         
+        base = self.add_vertices(vertices)
+        
         # Создание треугольников
         for i in range(segments):
             for j in range(segments):
-                v1 = i * segments + j
-                v2 = i * segments + (j + 1) % segments
-                v3 = (i + 1) * segments + j
-                v4 = (i + 1) * segments + (j + 1) % segments
+                v1 = base + i * segments + j
+                v2 = base + i * segments + (j + 1) % segments
+                v3 = base + (i + 1) * segments + j
+                v4 = base + (i + 1) * segments + (j + 1) % segments
                 
                 # Цвет зависит от высоты
                 color = [0.2, 0.6, 1.0, 1.0] if i < segments/2 else [0.1, 0.4, 0.8, 1.0]
                 
                 # Два треугольника на ячейку
-                self.triangles.append(Triangle(
-                    vertices[v1].copy(), vertices[v2].copy(), vertices[v3].copy(), color
-                ))
-                self.triangles.append(Triangle(
-                    vertices[v2].copy(), vertices[v4].copy(), vertices[v3].copy(), color
-                ))
+                self.add_triangle(v1, v2, v3, color)
+                self.add_triangle(v2, v4, v3, color)
     
-    def transform_vertex(self, vertex):
-        """Применение преобразований к вершине"""
-        # Масштабирование
-        v = Vector3(
-            vertex.x * self.scale.x,
-            vertex.y * self.scale.y,
-            vertex.z * self.scale.z
-        )
-        
-        # Вращение
-        v = v.rotate_x(self.rotation.x)
-        v = v.rotate_y(self.rotation.y)
-        v = v.rotate_z(self.rotation.z)
-        
-        # Позиционирование
-        v = v + self.position
-        
-        return v
+    def add_vertices(self, vertices):
+        """Добавление уникальных вершин; возвращает индекс первой из них"""
+        base = len(self.vertices)
+        self.vertices.extend(vertices)
+        self._triangles = None
+        self._arrays = None
+        return base
     
-    def update(self, dt):
-        """Обновление анимации"""
-        self.rotation.y += dt * 1.0
-        self.rotation.x += dt * 0.5
+    def add_triangle(self, v1, v2, v3, color):
+        """Добавление треугольника по индексам вершин"""
+        self.indices.append((v1, v2, v3))
+        self.colors.append(color)
+        self._triangles = None
+        self._arrays = None
+    
+    @property
+    def triangles(self):
+        """Список треугольников с копиями вершин (для совместимости)"""
+        if self._triangles is None:
+            self._triangles = [
+                Triangle(self.vertices[a].copy(), self.vertices[b].copy(),
+                         self.vertices[c].copy(), color)
+                for (a, b, c), color in zip(self.indices, self.colors)
+            ]
+        return self._triangles
+    
+    def get_arrays(self):
+        """Вершины (n, 3), индексы (m, 3) и цвета (m, 4) в массивах numpy"""
+        if self._arrays is None:
+            self._arrays = (
+                Vector3Array.from_vectors(self.vertices).data,
+                np.array(self.indices, dtype=np.int64).reshape(-1, 3),
+                np.array(self.colors, dtype=np.float64).reshape(-1, 4)
+            )
+        return self._arrays
+    
+    def freeze(self):
+        """Запрет изменений: меш становится общим неизменяемым шаблоном"""
+        self.vertices = tuple(self.vertices)
+        self.indices = tuple(self.indices)
+        self.colors = tuple(tuple(color) for color in self.colors)
+        self._triangles = None
+        self._arrays = None
+        for array in self.get_arrays():
+            array.flags.writeable = False
+        self.radius = max([v.length() for v in self.vertices], default=0)
+    
+    def transform_vertices(self):
+        """Преобразование всех уникальных вершин одним умножением на матрицу модели, результат (n, 3)"""
+        return transform_instances(self.get_arrays()[0], self.get_model_array()[None])[0]
+    
+    def get_bounding_radius(self):
+        """Радиус сферы вокруг position, охватывающей меш с учетом масштаба"""
+        radius = 0
+        for v in self.vertices:
+            radius = max(radius, v.length())
+        return radius * max(abs(self.scale.x), abs(self.scale.y), abs(self.scale.z))
+
+def transform_instances(points, matrices):
+    """Вершины шаблона (n, 3) для k экземпляров с матрицами модели (k, 4, 4), результат (k, n, 3)"""
+    return np.einsum('kij,nj->kni', matrices[:, :3, :3], points) + matrices[:, None, :3, 3]
+
+class LevelOfDetail:
+    """Выбор уровня детализации по радиусу объекта на экране с гистерезисом.
+    
+    thresholds - минимальный радиус в пикселях для уровней 0, 1, ... (по убыванию);
+    объект мельче всех порогов получает последний, самый грубый уровень.
+    Переход на другой уровень происходит, только когда размер ушел за порог
+    больше чем на долю hysteresis, поэтому на границе уровни не мерцают
+    """
+    def __init__(self, thresholds, hysteresis=0.2):
+        self.thresholds = tuple(thresholds)
+        self.hysteresis = hysteresis
+        self.descending = -np.array(self.thresholds, dtype=np.float64)
+    
+    @staticmethod
+    def screen_radius(radius, distance, focal):
+        """Радиус на экране в пикселях для фокусного расстояния focal (в пикселях)"""
+        return radius * focal / np.maximum(distance, 1e-6)
+    
+    def level_for(self, size):
+        """Уровень без учета гистерезиса"""
+        return sum(1 for threshold in self.thresholds if threshold > size)
+    
+    def select_one(self, size, current):
+        """Новый уровень одного объекта"""
+        finer = self.level_for(size / (1 + self.hysteresis))
+        if finer < current:
+            return finer
+        coarser = self.level_for(size * (1 + self.hysteresis))
+        if coarser > current:
+            return coarser
+        return current
+    
+    def select(self, sizes, current):
+        """Новые уровни для массивов размеров и текущих уровней"""
+        finer = np.searchsorted(self.descending, -sizes / (1 + self.hysteresis), side='left')
+        coarser = np.searchsorted(self.descending, -sizes * (1 + self.hysteresis), side='left')
+        return np.where(finer < current, finer, np.where(coarser > current, coarser, current))
+
+class MeshInstance(ModelTransform):
+    """Экземпляр общего меша: собственные только преобразование и оттенок.
+    
+    Шаблон с уровнями детализации задается списком мешей от подробного
+    к грубому; текущий уровень выбирает движок по размеру на экране
+    """
+    def __init__(self, template, position, tint=(1, 1, 1, 1), lod=None):
+        super().__init__(position)
+        self.levels = template if isinstance(template, (list, tuple)) else [template]
+        self.level = 0
+        self.lod = lod
+        self.tint = tint
+    
+    @property
+    def template(self):
+        """Меш текущего уровня детализации"""
+        return self.levels[self.level]
+    
+    @property
+    def triangles(self):
+        """Треугольники шаблона в локальных координатах (для совместимости)"""
+        return self.template.triangles
+    
+    def get_bounding_radius(self):
+        """Радиус сферы вокруг position, охватывающей экземпляр с учетом масштаба"""
+        return self.template.radius * max(abs(self.scale.x), abs(self.scale.y), abs(self.scale.z))
+
+class MeshTemplates:
+    """Реестр шаблонов: меш каждого типа строится один раз и делится между экземплярами"""
+    def __init__(self):
+        self.builders = {}
+        self.templates = {}
+        self.lods = {}
+    
+    def register(self, name, builder):
+        """Регистрация функции, заполняющей пустой Mesh3D"""
+        self.builders[name] = builder
+        self.templates.pop(name, None)
+    
+    def register_lod(self, name, builders, thresholds, hysteresis=0.2):
+        """Шаблон с уровнями детализации: builders от подробного к грубому"""
+        for level, builder in enumerate(builders):
+            self.register(f'{name}#{level}', builder)
+        self.lods[name] = (len(builders), LevelOfDetail(thresholds, hysteresis))
+    
+    def get(self, name):
+        """Общий неизменяемый меш шаблона"""
+        template = self.templates.get(name)
+        if template is None:
+            template = Mesh3D()
+            self.builders[name](template)
+            template.freeze()
+            self.templates[name] = template
+        return template
+    
+    def instance(self, name, position, tint=(1, 1, 1, 1)):
+        """Новый экземпляр шаблона"""
+        if name in self.lods:
+            count, lod = self.lods[name]
+            levels = [self.get(f'{name}#{level}') for level in range(count)]
+            return MeshInstance(levels, position, tint, lod)
+        return MeshInstance(self.get(name), position, tint)
+
+MESH_TEMPLATES = MeshTemplates()
+MESH_TEMPLATES.register('demon', lambda mesh: mesh.create_pyramid(height=1.5, base_size=0.8))
+MESH_TEMPLATES.register('zombie', lambda mesh: mesh.create_cube(size=0.8))
+MESH_TEMPLATES.register_lod('sphere', [
+    lambda mesh: mesh.create_sphere(radius=0.5, segments=16),
+    lambda mesh: mesh.create_sphere(radius=0.5, segments=8),
+    lambda mesh: mesh.create_sphere(radius=0.5, segments=4)
+], thresholds=(40, 10))
 
 class Camera3D:
     """3D камера с управлением от первого лица"""
     def __init__(self):
+        # Кэш матриц: вид сбрасывается движением и поворотом,
+        # проекция пересчитывается при смене соотношения сторон
+        self._view = None
+        self._projection = None
+        self._projection_key = None
+        self._view_projection = None
+        
         self.position = Vector3(0, 1.7, 0)  # Рост человека
         self.rotation = Vector3(0, 0, 0)    # Углы Эйлера (pitch, yaw, roll)
         
@@ -337,8 +470,24 @@ class Camera3D:
         
         self.update_vectors()
     
+    @property
+    def position(self):
+        return self._position
+    
+    @position.setter
+    def position(self, value):
+        self._position = value
+        self.invalidate_view()
+    
+    def invalidate_view(self):
+        """Сброс кэша матрицы вида после движения или поворота"""
+        self._view = None
+        self._view_projection = None
+    
     def update_vectors(self):
         """Обновление векторов направления"""
+        self.invalidate_view()
+        
         # Вычисляем направление взгляда из углов Эйлера
         self.forward = Vector3(
             math.sin(self.rotation.y) * math.cos(self.rotation.x),
@@ -350,22 +499,28 @@ class Camera3D:
         self.up = self.forward.cross(self.right).normalize()
     
     def move_forward(self, dt):
-        self.position += self.forward * self.move_speed * dt
+        self.position.add_scaled(self.forward, self.move_speed * dt)
+        self.invalidate_view()
     
     def move_backward(self, dt):
-        self.position -= self.forward * self.move_speed * dt
+        self.position.add_scaled(self.forward, -self.move_speed * dt)
+        self.invalidate_view()
     
     def move_left(self, dt):
-        self.position -= self.right * self.move_speed * dt
+        self.position.add_scaled(self.right, -self.move_speed * dt)
+        self.invalidate_view()
     
     def move_right(self, dt):
-        self.position += self.right * self.move_speed * dt
+        self.position.add_scaled(self.right, self.move_speed * dt)
+        self.invalidate_view()
     
     def move_up(self, dt):
-        self.position += Vector3(0, 1, 0) * self.move_speed * dt
+        self.position.y += self.move_speed * dt
+        self.invalidate_view()
     
     def move_down(self, dt):
-        self.position -= Vector3(0, 1, 0) * self.move_speed * dt
+        self.position.y -= self.move_speed * dt
+        self.invalidate_view()
     
     def rotate_with_keys(self, dx, dy):
         """Вращение камеры с помощью клавиш"""
@@ -389,24 +544,684 @@ class Camera3D:
     
     def get_view_matrix(self):
         """Получить матрицу вида"""
-        target = self.position + self.forward
-        return Matrix4.look_at(self.position, target, Vector3(0, 1, 0))
+        if self._view is None:
+            target = self.position + self.forward
+            self._view = Matrix4.look_at(self.position, target, Vector3(0, 1, 0))
+        return self._view
     
     def get_projection_matrix(self, aspect_ratio):
         """Получить матрицу проекции"""
-        return Matrix4.perspective(self.fov, aspect_ratio, self.near, self.far)
+        key = (aspect_ratio, self.fov, self.near, self.far)
+        if key != self._projection_key:
+            self._projection_key = key
+            self._projection = Matrix4.perspective(self.fov, aspect_ratio, self.near, self.far)
+            self._view_projection = None
+        return self._projection
+    
+    def get_view_projection_matrix(self, aspect_ratio):
+        """Произведение проекции и вида; пересчитывается вместе с ними"""
+        projection = self.get_projection_matrix(aspect_ratio)
+        if self._view_projection is None:
+            self._view_projection = projection.multiply(self.get_view_matrix())
+        return self._view_projection
+
+class BSPTree:
+    """BSP-дерево статических треугольников: порядок отрисовки без сортировки"""
+    # Допуск при классификации вершин относительно плоскости
+    EPSILON = 1e-5
+    
+    def __init__(self, vertices, candidates=12):
+        """vertices - массив (n, 3, 3) с вершинами исходных треугольников"""
+        self.candidates = candidates
+        
+        # Узлы дерева в параллельных списках
+        self.normals = []
+        self.offsets = []
+        self.front = []
+        self.back = []
+        self.node_triangles = []
+        
+        # Фрагменты (треугольники после разрезания) и их исходные индексы
+        self.fragments = [tuple(map(tuple, tri)) for tri in np.asarray(vertices).tolist()]
+        self.source = list(range(len(self.fragments)))
+        
+        self.build()
+        
+        # Разрезанные треугольники заменены своими фрагментами: перенумеровываем
+        # только фрагменты, попавшие в узлы дерева
+        used = [index for tris in self.node_triangles for index in tris]
+        remap = {index: i for i, index in enumerate(used)}
+        self.node_triangles = [[remap[index] for index in tris] for tris in self.node_triangles]
+        
+        self.vertices = np.array([self.fragments[i] for i in used], dtype=np.float64).reshape(-1, 3, 3)
+        self.source = np.array([self.source[i] for i in used], dtype=np.int64)
+        del self.fragments
+        # Обход дерева идет на скалярах Python, place - на массивах numpy:
+        # узлы хранятся в обоих видах
+        self.normal_list = [tuple(normal) for normal in self.normals]
+        self.offset_list = [float(offset) for offset in self.offsets]
+        self.normals = np.array(self.normals, dtype=np.float64).reshape(-1, 3)
+        self.offsets = np.array(self.offsets, dtype=np.float64)
+        self.front_children = np.array(self.front, dtype=np.int64)
+        self.back_children = np.array(self.back, dtype=np.int64)
+        
+        # Родитель каждого узла (-1 у корня) для подъема от занятых слотов
+        self.parent = [-1] * len(self.front)
+        for node, children in enumerate(zip(self.front, self.back)):
+            for child in children:
+                if child >= 0:
+                    self.parent[child] = node
+        self.set_groups(np.zeros(len(self.source), dtype=np.int64))
+    
+    def set_groups(self, fragment_group):
+        """Группы отсечения фрагментов: обход пропускает поддеревья без видимых групп.
+        
+        Группы узла и поддерева хранятся битовыми масками (целые Python),
+        фрагменты узла разложены по группам
+        """
+        group = np.asarray(fragment_group).tolist()
+        self.node_groups = []
+        self.node_mask = []
+        for tris in self.node_triangles:
+            by_group = {}
+            for index in tris:
+                by_group.setdefault(group[index], []).append(index)
+            self.node_groups.append(by_group)
+            mask = 0
+            for g in by_group:
+                mask |= 1 << g
+            self.node_mask.append(mask)
+        
+        # Дети создаются после родителя, поэтому поддеревья собираются с конца
+        self.subtree_mask = list(self.node_mask)
+        for node in range(len(self.subtree_mask) - 1, -1, -1):
+            parent = self.parent[node]
+            if parent >= 0:
+                self.subtree_mask[parent] |= self.subtree_mask[node]
+    
+    @staticmethod
+    def mask_of(flags):
+        """Битовая маска групп из булева массива видимости"""
+        return int.from_bytes(np.packbits(flags, bitorder='little').tobytes(), 'little')
+    
+    def build(self):
+        """Построение дерева (итеративно, без рекурсии)"""
+        root = list(range(len(self.fragments)))
+        if not root:
+            return
+        
+        # В стеке лежат (набор треугольников, родитель, сторона у родителя)
+        stack = [(root, -1, None)]
+        while stack:
+            indices, parent, side = stack.pop()
+            node = self.create_node(indices)
+            
+            if parent >= 0:
+                if side == 'front':
+                    self.front[parent] = node
+                else:
+                    self.back[parent] = node
+            
+            front, back = self.pending
+            if front:
+                stack.append((front, node, 'front'))
+            if back:
+                stack.append((back, node, 'back'))
+    
+    def plane_of(self, index):
+        """Плоскость треугольника: нормаль и смещение"""
+        v1, v2, v3 = (Vector3(*v) for v in self.fragments[index])
+        normal = (v2 - v1).cross(v3 - v1).normalize()
+        return normal, normal.dot(v1)
+    
+    def classify(self, indices, normal, offset):
+        """Знаковые расстояния вершин треугольников до плоскости, форма (m, 3)"""
+        tris = np.array([self.fragments[i] for i in indices], dtype=np.float64)
+        return tris @ np.array(normal.to_tuple()) - offset
+    
+    def choose_splitter(self, indices):
+        """Выбор делящего треугольника среди нескольких кандидатов"""
+        count = len(indices)
+        step = max(1, count // self.candidates)
+        best = None
+        
+        for position in range(0, count, step)[:self.candidates]:
+            candidate = indices[position]
+            normal, offset = self.plane_of(candidate)
+            if normal.length() == 0:
+                continue
+            
+            distances = self.classify(indices, normal, offset)
+            front = np.all(distances >= -self.EPSILON, axis=1)
+            back = np.all(distances <= self.EPSILON, axis=1)
+            coplanar = front & back
+            splits = count - int(np.count_nonzero(front | back))
+            
+            # Меньше разрезов, лучше баланс; большие компланарные наборы (пол) - в один узел
+            score = (splits * 8
+                     + abs(int(np.count_nonzero(front & ~coplanar)) - int(np.count_nonzero(back & ~coplanar)))
+                     - int(np.count_nonzero(coplanar)))
+            if best is None or score < best[0]:
+                best = (score, normal, offset, distances)
+        
+        return best
+    
+    def create_node(self, indices):
+        """Создание узла и распределение треугольников по сторонам"""
+        best = self.choose_splitter(indices)
+        node = len(self.normals)
+        self.front.append(-1)
+        self.back.append(-1)
+        
+        if best is None:
+            # Только вырожденные треугольники: кладем их в узел как есть
+            self.normals.append((0.0, 1.0, 0.0))
+            self.offsets.append(0.0)
+            self.node_triangles.append(list(indices))
+            self.pending = ([], [])
+            return node
+        
+        score, normal, offset, distances = best
+        self.normals.append(normal.to_tuple())
+        self.offsets.append(offset)
+        
+        coplanar = []
+        front = []
+        back = []
+        for index, d in zip(indices, distances.tolist()):
+            is_front = min(d) >= -self.EPSILON
+            is_back = max(d) <= self.EPSILON
+            if is_front and is_back:
+                coplanar.append(index)
+            elif is_front:
+                front.append(index)
+            elif is_back:
+                back.append(index)
+            else:
+                front_part, back_part = self.split(index, d)
+                front.extend(front_part)
+                back.extend(back_part)
+        
+        self.node_triangles.append(coplanar)
+        self.pending = (front, back)
+        return node
+    
+    def split(self, index, distances):
+        """Разрезание треугольника плоскостью на фрагменты спереди и сзади"""
+        points = self.fragments[index]
+        source = self.source[index]
+        front_poly = []
+        back_poly = []
+        
+        for i in range(3):
+            p, dp = points[i], distances[i]
+            q, dq = points[(i + 1) % 3], distances[(i + 1) % 3]
+            
+            if dp >= -self.EPSILON:
+                front_poly.append(p)
+            if dp <= self.EPSILON:
+                back_poly.append(p)
+            
+            # Ребро пересекает плоскость - добавляем точку пересечения в обе части
+            if (dp > self.EPSILON and dq < -self.EPSILON) or (dp < -self.EPSILON and dq > self.EPSILON):
+                t = dp / (dp - dq)
+                point = tuple(p[k] + (q[k] - p[k]) * t for k in range(3))
+                front_poly.append(point)
+                back_poly.append(point)
+        
+        parts = []
+        for poly in (front_poly, back_poly):
+            part = []
+            # Веер треугольников сохраняет порядок обхода (и нормаль) исходного
+            for i in range(1, len(poly) - 1):
+                self.fragments.append((poly[0], poly[i], poly[i + 1]))
+                self.source.append(source)
+                part.append(len(self.fragments) - 1)
+            parts.append(part)
+        
+        return parts
+    
+    def place(self, points):
+        """Листовые позиции ("слоты") для точек, например центров динамических треугольников"""
+        count = len(points)
+        slots = np.full(count, -1, dtype=np.int64)
+        if count == 0 or len(self.offsets) == 0:
+            return slots
+        
+        node = np.zeros(count, dtype=np.int64)
+        active = np.arange(count)
+        
+        # Все точки спускаются по дереву одновременно, по уровню за шаг
+        while active.size:
+            k = node[active]
+            side = np.einsum('ij,ij->i', self.normals[k], points[active]) - self.offsets[k]
+            in_front = side >= 0
+            child = np.where(in_front, self.front_children[k], self.back_children[k])
+            
+            done = child < 0
+            slots[active[done]] = k[done] * 2 + (~in_front[done])
+            node[active[~done]] = child[~done]
+            active = active[~done]
+        
+        return slots
+    
+    def back_to_front(self, eye, slots=None, visible=None):
+        """Индексы фрагментов от дальних к ближним для точки обзора eye.
+        
+        slots - словарь {слот: список индексов}, вставляемых в пустые листья;
+        visible - маска видимых групп (mask_of): фрагменты остальных групп
+        не выводятся, а поддеревья без видимых групп и занятых слотов не обходятся
+        """
+        order = []
+        if len(self.offsets) == 0:
+            if slots:
+                for items in slots.values():
+                    order.extend(items)
+            return order
+        
+        ex, ey, ez = eye.x, eye.y, eye.z
+        normals = self.normal_list
+        offsets = self.offset_list
+        node_triangles = self.node_triangles
+        node_groups = self.node_groups
+        node_mask = self.node_mask
+        subtree_mask = self.subtree_mask
+        front = self.front
+        back = self.back
+        
+        # Узлы на пути от корня к занятым слотам обходятся всегда
+        forced = set()
+        if visible is not None and slots:
+            parent = self.parent
+            for slot in slots:
+                node = slot >> 1
+                while node >= 0 and node not in forced:
+                    forced.add(node)
+                    node = parent[node]
+        
+        # Элементы стека: индекс узла (>= 0), ~индекс узла для вывода его
+        # треугольников или список динамических индексов из слота
+        stack = [0] if visible is None or subtree_mask[0] & visible or 0 in forced else []
+        while stack:
+            k = stack.pop()
+            
+            if type(k) is list:
+                order.extend(k)
+                continue
+            if k < 0:
+                k = ~k
+                mask = node_mask[k]
+                if visible is None or mask & visible == mask:
+                    order.extend(node_triangles[k])
+                    continue
+                
+                # Узел виден частично: фрагменты видимых групп в исходном порядке узла
+                mask &= visible
+                groups = node_groups[k]
+                part = []
+                while mask:
+                    low = mask & -mask
+                    part.extend(groups[low.bit_length() - 1])
+                    mask ^= low
+                part.sort()
+                order.extend(part)
+                continue
+            
+            nx, ny, nz = normals[k]
+            if nx * ex + ny * ey + nz * ez - offsets[k] >= 0:
+                # Камера спереди: сначала задняя сторона, затем узел, затем передняя
+                near, near_slot = front[k], k * 2
+                far, far_slot = back[k], k * 2 + 1
+            else:
+                near, near_slot = back[k], k * 2 + 1
+                far, far_slot = front[k], k * 2
+            
+            if near >= 0:
+                if visible is None or subtree_mask[near] & visible or near in forced:
+                    stack.append(near)
+            elif slots and near_slot in slots:
+                stack.append(slots[near_slot])
+            if visible is None or node_mask[k] & visible:
+                stack.append(~k)
+            if far >= 0:
+                if visible is None or subtree_mask[far] & visible or far in forced:
+                    stack.append(far)
+            elif slots and far_slot in slots:
+                stack.append(slots[far_slot])
+        
+        return order
+
+class DepthSorter:
+    """Порядок отрисовки от дальних к ближним с учетом порядка прошлого кадра.
+    
+    Пока камера движется плавно, порядок прошлого кадра почти верен и чинится
+    сортировкой вставками. При скачке камеры порядок строится заново
+    блочной сортировкой по квантованному квадрату расстояния.
+    """
+    def __init__(self, jump_distance=2.0, buckets=4096, max_shifts=4):
+        self.jump_distance = jump_distance
+        self.buckets = min(buckets, 65536)
+        # Предел сдвигов при починке: max_shifts * n, дальше - полная пересортировка
+        self.max_shifts = max_shifts
+        
+        self.keys = []
+        self.eye = None
+        
+        # Статистика последнего вызова: способ и число переставленных элементов
+        self.mode = None
+        self.moved = 0
+    
+    def sort(self, keys, distances, eye):
+        """Позиции элементов от дальнего к ближнему.
+        
+        keys - устойчивые между кадрами идентификаторы элементов,
+        distances - массив квадратов расстояний до камеры
+        """
+        distances = np.asarray(distances, dtype=np.float64)
+        count = len(keys)
+        
+        jumped = (self.eye is None or
+                  self.eye.distance_to(eye) > self.jump_distance)
+        
+        order = None
+        if not jumped:
+            order = self.repair(keys, distances.tolist())
+        
+        if order is None:
+            # Полная пересортировка: переставленными считаются все элементы
+            self.mode = 'bucket'
+            order = self.bucket_sort(distances)
+            # Квантование оставляет небольшие перестановки внутри блоков
+            self.insertion_sort(order, distances.tolist(), limit=None)
+            self.moved = count
+        else:
+            self.mode = 'repair'
+        
+        self.keys = [keys[index] for index in order]
+        self.eye = eye.copy()
+        return order
+    
+    def repair(self, keys, distances):
+        """Починка порядка прошлого кадра; None, если он слишком устарел"""
+        position = {key: i for i, key in enumerate(keys)}
+        
+        # Порядок прошлого кадра для оставшихся элементов, новые - в конец
+        order = [position[key] for key in self.keys if key in position]
+        added = len(keys) - len(order)
+        if added:
+            seen = set(order)
+            order.extend(i for i in range(len(keys)) if i not in seen)
+        
+        moved = self.insertion_sort(order, distances, limit=self.max_shifts * len(keys))
+        if moved is None:
+            return None
+        
+        self.moved = moved + added
+        return order
+    
+    def insertion_sort(self, order, distances, limit):
+        """Сортировка вставками по убыванию расстояния на месте: O(n) для почти
+        упорядоченных данных. Возвращает число переставленных элементов или None,
+        если число сдвигов превысило limit
+        """
+        shifts = 0
+        moved = 0
+        for i in range(1, len(order)):
+            item = order[i]
+            d = distances[item]
+            j = i - 1
+            while j >= 0 and distances[order[j]] < d:
+                order[j + 1] = order[j]
+                j -= 1
+            
+            if j != i - 1:
+                order[j + 1] = item
+                moved += 1
+                shifts += i - 1 - j
+                if limit is not None and shifts > limit:
+                    return None
+        return moved
+    
+    def bucket_sort(self, distances):
+        """Блочная сортировка по квантованному расстоянию"""
+        if len(distances) == 0:
+            return []
+        
+        low = distances.min()
+        span = distances.max() - low
+        if span <= 0:
+            return list(range(len(distances)))
+        
+        buckets = ((distances - low) * ((self.buckets - 1) / span)).astype(np.uint16)
+        # Устойчивая сортировка 16-битных ключей в numpy выполняется поразрядно (radix)
+        return np.argsort(self.buckets - 1 - buckets, kind='stable').tolist()
+
+class Frustum:
+    """Пирамида видимости в мировых координатах (шесть плоскостей)"""
+    # Результаты проверки рамки
+    OUTSIDE = 0
+    INTERSECT = 1
+    INSIDE = 2
+    
+    def __init__(self, view_projection):
+        """Плоскости извлекаются из строк матрицы вид-проекция"""
+        r0, r1, r2, r3 = (view_projection.row(i) for i in range(4))
+        
+        self.planes = []
+        for sign, row in ((1, r0), (-1, r0), (1, r1), (-1, r1), (1, r2), (-1, r2)):
+            a = r3[0] + sign * row[0]
+            b = r3[1] + sign * row[1]
+            c = r3[2] + sign * row[2]
+            d = r3[3] + sign * row[3]
+            length = math.sqrt(a*a + b*b + c*c)
+            self.planes.append((a / length, b / length, c / length, d / length))
+    
+    def test_box(self, box_min, box_max):
+        """Положение рамки (min, max) относительно пирамиды"""
+        result = self.INSIDE
+        for a, b, c, d in self.planes:
+            # Самая "внутренняя" и самая "внешняя" вершины рамки вдоль нормали
+            px, nx = (box_max[0], box_min[0]) if a >= 0 else (box_min[0], box_max[0])
+            py, ny = (box_max[1], box_min[1]) if b >= 0 else (box_min[1], box_max[1])
+            pz, nz = (box_max[2], box_min[2]) if c >= 0 else (box_min[2], box_max[2])
+            
+            if a * px + b * py + c * pz + d < 0:
+                return self.OUTSIDE
+            if a * nx + b * ny + c * nz + d < 0:
+                result = self.INTERSECT
+        return result
+
+class BoundingVolumeHierarchy:
+    """Иерархия ограничивающих рамок (AABB) для отсечения по пирамиде видимости"""
+    def __init__(self, box_min, box_max, leaf_size=4):
+        """box_min, box_max - массивы (n, 3) с рамками объектов"""
+        self.leaf_size = leaf_size
+        self.box_min = np.asarray(box_min, dtype=np.float64).reshape(-1, 3)
+        self.box_max = np.asarray(box_max, dtype=np.float64).reshape(-1, 3)
+        self.item_min = self.box_min.tolist()
+        self.item_max = self.box_max.tolist()
+        
+        # Узлы: рамка, дети (-1 у листа) и объекты листа
+        self.node_min = []
+        self.node_max = []
+        self.children = []
+        self.items = []
+        
+        if len(self.box_min):
+            self.build()
+    
+    def build(self):
+        """Построение делением по медиане вдоль самой длинной оси центров"""
+        centers = (self.box_min + self.box_max) * 0.5
+        
+        stack = [(np.arange(len(self.box_min)), -1, 0)]
+        while stack:
+            items, parent, side = stack.pop()
+            node = len(self.node_min)
+            self.node_min.append(self.box_min[items].min(axis=0).tolist())
+            self.node_max.append(self.box_max[items].max(axis=0).tolist())
+            self.children.append([-1, -1])
+            self.items.append([])
+            if parent >= 0:
+                self.children[parent][side] = node
+            
+            if len(items) <= self.leaf_size:
+                self.items[node] = items.tolist()
+                continue
+            
+            extent = centers[items].max(axis=0) - centers[items].min(axis=0)
+            axis = int(np.argmax(extent))
+            items = items[np.argsort(centers[items, axis], kind='stable')]
+            half = len(items) // 2
+            stack.append((items[half:], node, 1))
+            stack.append((items[:half], node, 0))
+    
+    def query(self, frustum):
+        """Индексы объектов, рамки которых пересекают пирамиду видимости"""
+        visible = []
+        if not self.node_min:
+            return visible
+        
+        stack = [(0, False)]
+        while stack:
+            node, inside = stack.pop()
+            
+            if not inside:
+                result = frustum.test_box(self.node_min[node], self.node_max[node])
+                if result == Frustum.OUTSIDE:
+                    continue
+                inside = result == Frustum.INSIDE
+            
+            left, right = self.children[node]
+            if left < 0:
+                items = self.items[node]
+                if inside:
+                    visible.extend(items)
+                else:
+                    # В листе проверяем рамки самих объектов
+                    for item in items:
+                        if frustum.test_box(self.item_min[item], self.item_max[item]) != Frustum.OUTSIDE:
+                            visible.append(item)
+                continue
+            
+            # Целиком видимое поддерево больше не проверяется
+            stack.append((right, inside))
+            stack.append((left, inside))
+        
+        return visible
 
 class GridMap:
     """Карта с сеткой и объектами"""
-    def __init__(self, width=40, depth=40, cell_size=2):
+    def __init__(self, width=40, depth=40, cell_size=2, floor_mode='cells'):
         self.width = width
         self.depth = depth
         self.cell_size = cell_size
         self.grid = []
         self.objects = []
         
+        # Объекты с уровнями детализации: в self.objects лежат треугольники
+        # всех уровней, object_levels[индекс объекта] - уровень каждого из них
+        self.object_levels = {}
+        self.lod_objects = []
+        self.lod_centers = []
+        self.lod_radii = []
+        self.column_lod = LevelOfDetail(COLUMN_LOD_THRESHOLDS)
+        
+        # Крупные объекты (стены и платформы), которые могут закрывать остальное
+        self.occluder_objects = []
+        
+        # 'cells' - пол из треугольников в шахматном порядке,
+        # 'texture' - пол рисуется движком крупными текстурированными плитками
+        self.floor_mode = floor_mode
+        self.floor_tiles = []
+        
         self.create_grid()
+        self.create_floor_tiles()
         self.place_objects()
+        self.pack_static_geometry()
+    
+    def pack_static_geometry(self, floor_block=4):
+        """Упаковка статической геометрии карты в массивы для пакетной проекции"""
+        self.static_triangles = []
+        is_object = []
+        lod_object = []
+        lod_level = []
+        
+        # Группа - единица отсечения: объект карты или блок floor_block x floor_block ячеек пола
+        groups = []
+        block_groups = {}
+        
+        for index, cell in enumerate(self.grid):
+            if not cell['triangles']:
+                continue
+            block = (index // self.depth // floor_block, index % self.depth // floor_block)
+            group = block_groups.setdefault(block, len(block_groups))
+            for triangle in cell['triangles']:
+                self.static_triangles.append(triangle)
+                is_object.append(False)
+                groups.append(group)
+                lod_object.append(-1)
+                lod_level.append(-1)
+        
+        lod_index = {object_index: i for i, object_index in enumerate(self.lod_objects)}
+        for object_index, obj in enumerate(self.objects):
+            group = len(block_groups) + object_index
+            levels = self.object_levels.get(object_index)
+            for triangle_index, triangle in enumerate(obj):
+                self.static_triangles.append(triangle)
+                is_object.append(True)
+                groups.append(group)
+                lod_object.append(lod_index[object_index] if levels else -1)
+                lod_level.append(levels[triangle_index] if levels else -1)
+        
+        # Треугольники карты не двигаются: BSP-дерево строится один раз,
+        # а массивы для отрисовки берутся из его фрагментов
+        vertices = pack_triangles(self.static_triangles).reshape(-1, 3, 3)
+        self.bsp = BSPTree(vertices)
+        colors = np.array([t.color for t in self.static_triangles], dtype=np.float64)
+        
+        self.static_source = self.bsp.source
+        self.static_vertices = self.bsp.vertices.reshape(-1, 3)
+        self.static_colors = colors[self.static_source]
+        self.static_is_object = np.array(is_object, dtype=bool)[self.static_source]
+        
+        # Все уровни детализации лежат в одном BSP-дереве: порядок его обхода
+        # верен для любого подмножества фрагментов, а уровень выбирается маской
+        self.static_lod_object = np.array(lod_object, dtype=np.int64)[self.static_source]
+        self.static_lod_level = np.array(lod_level, dtype=np.int64)[self.static_source]
+        self.lod_centers = np.array(self.lod_centers, dtype=np.float64).reshape(-1, 3)
+        self.lod_radii = np.array(self.lod_radii, dtype=np.float64)
+        
+        # Центры и нормали фрагментов считаются один раз; нормаль берется
+        # у исходного треугольника, фрагмент лежит в той же плоскости
+        self.static_centers = self.bsp.vertices.mean(axis=1)
+        self.static_normals = pack_normals(self.static_triangles)[self.static_source]
+        
+        # Рамки групп собираются в иерархию для отсечения по пирамиде видимости
+        groups = np.array(groups, dtype=np.int64)
+        self.group_count = len(block_groups) + len(self.objects)
+        group_min = np.full((self.group_count, 3), np.inf)
+        group_max = np.full((self.group_count, 3), -np.inf)
+        np.minimum.at(group_min, groups, vertices.min(axis=1))
+        np.maximum.at(group_max, groups, vertices.max(axis=1))
+        
+        self.static_group = groups[self.static_source]
+        self.group_min = group_min
+        self.group_max = group_max
+        self.bvh = BoundingVolumeHierarchy(group_min, group_max)
+        
+        self.group_occluder = np.zeros(self.group_count, dtype=bool)
+        self.group_occluder[len(block_groups) + np.array(self.occluder_objects, dtype=np.int64)] = True
+        
+        # Наборы отсечения для обхода BSP: сначала группы, затем по набору на каждый
+        # уровень каждого объекта с детализацией, чтобы обход пропускал невыбранные уровни
+        level_counts = [max(self.object_levels[object_index]) + 1 for object_index in self.lod_objects]
+        self.lod_group = len(block_groups) + np.array(self.lod_objects, dtype=np.int64)
+        self.lod_set = self.group_count + np.cumsum([0] + level_counts[:-1], dtype=np.int64)
+        self.cull_count = self.group_count + sum(level_counts)
+        
+        static_set = np.append(self.lod_set, 0)[self.static_lod_object] + self.static_lod_level
+        self.bsp.set_groups(np.where(self.static_lod_object >= 0, static_set, self.static_group))
     
     def create_grid(self):
         """Создание сетки карты"""
@@ -426,6 +1241,11 @@ class GridMap:
                 else:
                     color = [0.5, 0.5, 0.5, 1]  # Темно-серый
                 
+                # В режиме текстуры ячейка остается без треугольников
+                if self.floor_mode != 'cells':
+                    self.grid.append({'x': cell_x, 'z': cell_z, 'triangles': []})
+                    continue
+                
                 # Создаем квадрат (2 треугольника)
                 half_cell = self.cell_size / 2
                 vertices = [
@@ -444,6 +1264,19 @@ class GridMap:
                     ]
                 })
     
+    def create_floor_tiles(self, tiles_per_side=4):
+        """Разбиение пола на крупные плитки (x0, z0, x1, z1) для текстурированной отрисовки"""
+        half_width = self.width * self.cell_size / 2
+        half_depth = self.depth * self.cell_size / 2
+        tile_width = self.width * self.cell_size / tiles_per_side
+        tile_depth = self.depth * self.cell_size / tiles_per_side
+        
+        for i in range(tiles_per_side):
+            for j in range(tiles_per_side):
+                x0 = -half_width + i * tile_width
+                z0 = -half_depth + j * tile_depth
+                self.floor_tiles.append((x0, z0, x0 + tile_width, z0 + tile_depth))
+    
     def place_objects(self):
         """Размещение объектов на карте"""
         half_width = self.width * self.cell_size / 2
@@ -458,28 +1291,28 @@ class GridMap:
             if x % 4 == 0:  # Размещаем стены через каждые 4 ячейки
                 wall_x = -half_width + x * self.cell_size + self.cell_size / 2
                 wall_z = -half_depth
-                self.objects.append(self.create_wall_segment(wall_x, wall_z, wall_height, wall_color, 'north'))
+                self.add_occluder(self.create_wall_segment(wall_x, wall_z, wall_height, wall_color, 'north'))
         
         # Южная стена (z = half_depth)
         for x in range(self.width):
             if x % 4 == 0:
                 wall_x = -half_width + x * self.cell_size + self.cell_size / 2
                 wall_z = half_depth
-                self.objects.append(self.create_wall_segment(wall_x, wall_z, wall_height, wall_color, 'south'))
+                self.add_occluder(self.create_wall_segment(wall_x, wall_z, wall_height, wall_color, 'south'))
         
         # Западная стена (x = -half_width)
         for z in range(self.depth):
             if z % 4 == 0:
                 wall_x = -half_width
                 wall_z = -half_depth + z * self.cell_size + self.cell_size / 2
-                self.objects.append(self.create_wall_segment(wall_x, wall_z, wall_height, wall_color, 'west'))
+                self.add_occluder(self.create_wall_segment(wall_x, wall_z, wall_height, wall_color, 'west'))
         
         # Восточная стена (x = half_width)
         for z in range(self.depth):
             if z % 4 == 0:
                 wall_x = half_width
                 wall_z = -half_depth + z * self.cell_size + self.cell_size / 2
-                self.objects.append(self.create_wall_segment(wall_x, wall_z, wall_height, wall_color, 'east'))
+                self.add_occluder(self.create_wall_segment(wall_x, wall_z, wall_height, wall_color, 'east'))
         
         # Случайные колонны
         for _ in range(20):
@@ -487,7 +1320,9 @@ class GridMap:
             col_z = random.uniform(-half_depth + 5, half_depth - 5)
             col_height = random.uniform(2, 5)
             col_radius = random.uniform(0.3, 0.8)
-            self.objects.append(self.create_column(col_x, col_z, col_height, col_radius))
+            levels = [self.create_column(col_x, col_z, col_height, col_radius, segments)
+                      for segments in COLUMN_LOD_SEGMENTS]
+            self.add_lod_object(levels, Vector3(col_x, col_height / 2, col_z), col_radius)
         
         # Платформы
         for _ in range(10):
@@ -495,7 +1330,7 @@ class GridMap:
             plat_z = random.uniform(-half_depth + 5, half_depth - 5)
             plat_height = random.uniform(1, 3)
             plat_size = random.uniform(2, 5)
-            self.objects.append(self.create_platform(plat_x, plat_z, plat_height, plat_size))
+            self.add_occluder(self.create_platform(plat_x, plat_z, plat_height, plat_size))
     
     def create_wall_segment(self, x, z, height, color, direction):
         """Создание сегмента стены"""
@@ -525,10 +1360,26 @@ class GridMap:
         
         return wall
     
-    def create_column(self, x, z, height, radius):
-        """Создание колонны"""
+    def add_occluder(self, triangles):
+        """Объект, который используется и как перекрыватель при отсечении"""
+        self.occluder_objects.append(len(self.objects))
+        self.objects.append(triangles)
+    
+    def add_lod_object(self, levels, center, radius):
+        """Объект с уровнями детализации: списки треугольников от подробного к грубому.
+        radius - размер объекта, по которому оценивается его радиус на экране
+        """
+        object_index = len(self.objects)
+        self.objects.append([triangle for triangles in levels for triangle in triangles])
+        self.object_levels[object_index] = [level for level, triangles in enumerate(levels)
+                                            for triangle in triangles]
+        self.lod_objects.append(object_index)
+        self.lod_centers.append(center.to_tuple())
+        self.lod_radii.append(radius)
+    
+    def create_column(self, x, z, height, radius, segments=8):
+        """Создание колонны с заданным числом граней"""
         column = []
-        segments = 8  # Количество граней
         
         # Цвет колонны
         color = [0.6, 0.6, 0.6, 1]
@@ -673,15 +1524,13 @@ class Enemy3D:
         self.type = enemy_type
         self.health = 100 if enemy_type == 'demon' else 50
         self.alive = True
-        self.mesh = Mesh3D()
-        self.mesh.position = position.copy()
         
+        # Геометрия общая для всех врагов типа, у врага - только экземпляр
+        self.mesh = MESH_TEMPLATES.instance(enemy_type, position)
         if enemy_type == 'demon':
-            self.mesh.create_pyramid(height=1.5, base_size=0.8)
-            self.mesh.color = [1, 0.2, 0.2, 1]
+            self.color = [1, 0.2, 0.2, 1]
         else:
-            self.mesh.create_cube(size=0.8)
-            self.mesh.color = [0.2, 1, 0.2, 1]
+            self.color = [0.2, 1, 0.2, 1]
         
         self.animation_time = 0
         self.bobbing_speed = 3
@@ -717,11 +1566,35 @@ class Enemy3D:
 
 class True3DEngine:
     """Полноценный 3D движок"""
-    def __init__(self):
+    def __init__(self, floor_mode='texture', render_mode='painter', zbuffer_size=(320, 240),
+                 occlusion=True):
         self.camera = Camera3D()
-        self.map = GridMap(width=40, depth=40, cell_size=2)
+        
+        # 'painter' - треугольники от дальних к ближним в порядке BSP-дерева,
+        # 'zbuffer' - программная растеризация с буфером глубины, без сортировки
+        self.render_mode = render_mode
+        self.rasterizer = ZBufferRasterizer(*zbuffer_size)
+        
+        # Треугольники мельче этой площади (в пикселях экрана) не отправляются
+        self.min_triangle_area = 0.5
+        
+        # Отсечение перекрытием: max_occluders ближайших стен и платформ
+        # растеризуются в грубый буфер глубины; None - без отсечения
+        self.occlusion = OcclusionBuffer() if occlusion else None
+        self.max_occluders = 8
+        
+        # Пол из floor.png; без файла текстуры - клетки из треугольников
+        if floor_mode == 'texture' and not os.path.exists(FLOOR_TEXTURE):
+            floor_mode = 'cells'
+        self.floor_mode = floor_mode
+        self.floor_texture = None
+        
+        self.map = GridMap(width=40, depth=40, cell_size=2, floor_mode=floor_mode)
         self.sky = Sky()
         
+        # Текущие уровни детализации объектов карты; меняются с гистерезисом
+        self.lod_levels = np.zeros(len(self.map.lod_radii), dtype=np.int64)
+        
         # Объекты в мире
         self.objects = []
         self.enemies = []
@@ -742,6 +1615,17 @@ class True3DEngine:
         self.screen_shake = 0
         self.blood_overlay = 0
         
+        # Постоянные слои отрисовки создаются при первом кадре
+        self.layers_canvas = None
+        
+        # Пирамида видимости для последней матрицы вид-проекция
+        self.frustum_matrix = None
+        self.frustum = None
+        
+        # Порядок динамических треугольников между кадрами и статистика кадра
+        self.depth_sorter = DepthSorter()
+        self.render_stats = {}
+        
         # Создаем объекты
         self.create_scene()
     
@@ -830,148 +1714,439 @@ class True3DEngine:
             if enemy.alive:
                 enemy.update(dt, self.camera.position)
     
-    def render_sky(self, canvas, width, height):
-        """Отрисовка неба"""
-        with canvas:
-            # Градиентное небо (от светло-голубого вверху к темно-синему внизу)
-            # Верхняя часть (светло-голубая)
-            Color(0.5, 0.7, 1.0, 1)
-            Rectangle(pos=(0, height // 2), size=(width, height // 2))
+    def create_layers(self, canvas):
+        """Создание постоянных слоев неба, мира и оверлеев (один раз на canvas)"""
+        canvas.clear()
+        self.layers_canvas = canvas
+        self.layers_size = None
+        
+        # Небо: градиент, солнце с лучами и облака
+        self.sky_layer = InstructionGroup()
+        self.sky_layer.add(Color(0.5, 0.7, 1.0, 1))
+        self.sky_top = Rectangle()
+        self.sky_layer.add(self.sky_top)
+        self.sky_layer.add(Color(0.1, 0.2, 0.4, 1))
+        self.sky_bottom = Rectangle()
+        self.sky_layer.add(self.sky_bottom)
+        
+        self.sky_layer.add(Color(1, 1, 0.8, 0.8))
+        self.sun_rays = []
+        for i in range(12):
+            ray = Line(points=[], width=3)
+            self.sun_rays.append(ray)
+            self.sky_layer.add(ray)
+        self.sky_layer.add(Color(1, 1, 0.5, 1))
+        self.sun = Ellipse()
+        self.sky_layer.add(self.sun)
+        
+        self.cloud_instructions = []
+        for cloud in self.sky.clouds:
+            color = Color(1, 1, 1, 0)
+            self.sky_layer.add(color)
+            puffs = []
+            for i in range(3):
+                puff = Ellipse()
+                puffs.append(puff)
+                self.sky_layer.add(puff)
+            self.cloud_instructions.append((color, puffs))
+        
+        # Мир: один пакет треугольников, сдвигаемый при тряске экрана
+        self.world_layer = InstructionGroup()
+        self.world_batch = ColorMeshBatch()
+        self.shake = Translate(0, 0)
+        self.world_layer.add(PushMatrix())
+        self.world_layer.add(self.shake)
+        
+        # Текстурированный пол рисуется первым: вся геометрия стоит на нем
+        if self.floor_mode == 'texture':
+            if self.floor_texture is None:
+                self.floor_texture = CoreImage(FLOOR_TEXTURE).texture
+                self.floor_texture.wrap = 'repeat'
+            self.floor_batch = TexturedPolygonBatch(self.floor_texture)
+            self.world_layer.add(self.floor_batch.context)
+        
+        self.world_layer.add(self.world_batch.context)
+        
+        # Кадр программного z-буфера выводится одной текстурой поверх пола
+        self.zbuffer_texture = None
+        self.zbuffer_color = Color(1, 1, 1, 0)
+        self.zbuffer_rect = Rectangle()
+        self.world_layer.add(self.zbuffer_color)
+        self.world_layer.add(self.zbuffer_rect)
+        self.world_layer.add(PopMatrix())
+        
+        # Оверлеи попадания и крови: видимость переключается прозрачностью
+        self.overlay_layer = InstructionGroup()
+        self.hit_color = Color(1, 0, 0, 0)
+        self.hit_rect = Rectangle()
+        self.blood_color = Color(1, 0, 0, 0)
+        self.blood_rect = Rectangle()
+        for instruction in (self.hit_color, self.hit_rect, self.blood_color, self.blood_rect):
+            self.overlay_layer.add(instruction)
+        
+        canvas.add(self.sky_layer)
+        canvas.add(self.world_layer)
+        canvas.add(self.overlay_layer)
+    
+    def render_sky(self, width, height):
+        """Обновление слоя неба"""
+        # Градиент и солнце зависят только от размеров экрана
+        if self.layers_size != (width, height):
+            self.layers_size = (width, height)
             
-            # Нижняя часть (темно-синяя)
-            Color(0.1, 0.2, 0.4, 1)
-            Rectangle(pos=(0, 0), size=(width, height // 2))
+            # Градиентное небо (от светло-голубого вверху к темно-синему внизу)
+            self.sky_top.pos = (0, height // 2)
+            self.sky_top.size = (width, height // 2)
+            self.sky_bottom.pos = (0, 0)
+            self.sky_bottom.size = (width, height // 2)
             
             # Солнце
-            Color(1, 1, 0.8, 0.8)
             sun_x = width * 0.8
             sun_y = height * 0.8
             sun_size = 60
             # Лучи солнца
-            for i in range(12):
+            for i, ray in enumerate(self.sun_rays):
                 angle = math.pi * 2 * i / 12
                 ray_length = sun_size * 1.5
                 end_x = sun_x + math.cos(angle) * ray_length
                 end_y = sun_y + math.sin(angle) * ray_length
-                Line(points=[sun_x, sun_y, end_x, end_y], width=3)
+                ray.points = [sun_x, sun_y, end_x, end_y]
             
             # Солнце (круг)
-            Color(1, 1, 0.5, 1)
-            from kivy.graphics import Ellipse
-            Ellipse(pos=(sun_x - sun_size/2, sun_y - sun_size/2), 
-                   size=(sun_size, sun_size))
-            
-            # Облака (простые овалы)
-            for cloud in self.sky.clouds:
-                # Проецируем облако на экран (упрощенная проекция)
-                cloud_x = (cloud['x'] - self.camera.position.x) * 0.5 + width / 2
-                cloud_y = (cloud['y'] - self.camera.position.y) * 0.5 + height / 2
-                cloud_size = cloud['size'] * 5
-                
-                if 0 < cloud_x < width and 0 < cloud_y < height:
-                    Color(1, 1, 1, 0.7)
-                    # Несколько овалов для каждого облака
-                    for i in range(3):
-                        offset_x = random.uniform(-10, 10)
-                        offset_y = random.uniform(-5, 5)
-                        Ellipse(pos=(cloud_x - cloud_size/2 + offset_x, 
-                                    cloud_y - cloud_size/4 + offset_y), 
-                               size=(cloud_size, cloud_size/2))
+            self.sun.pos = (sun_x - sun_size/2, sun_y - sun_size/2)
+            self.sun.size = (sun_size, sun_size)
+            
+            # Оверлеи во весь экран
+            self.hit_rect.size = (width, height)
+            self.blood_rect.size = (width, height)
+        
+        # Облака (простые овалы)
+        for cloud, (color, puffs) in zip(self.sky.clouds, self.cloud_instructions):
+            # Проецируем облако на экран (упрощенная проекция)
+            cloud_x = (cloud['x'] - self.camera.position.x) * 0.5 + width / 2
+            cloud_y = (cloud['y'] - self.camera.position.y) * 0.5 + height / 2
+            cloud_size = cloud['size'] * 5
+            
+            if 0 < cloud_x < width and 0 < cloud_y < height:
+                color.a = 0.7
+                # Несколько овалов для каждого облака
+                for puff in puffs:
+                    offset_x = random.uniform(-10, 10)
+                    offset_y = random.uniform(-5, 5)
+                    puff.pos = (cloud_x - cloud_size/2 + offset_x,
+                                cloud_y - cloud_size/4 + offset_y)
+                    puff.size = (cloud_size, cloud_size/2)
+            else:
+                color.a = 0
+    
+    def painter_order(self, static_index, static_count, centers, depth, enemy_keys, cam, cull_visible):
+        """Индексы треугольников кадра от дальних к ближним"""
+        enemy_count = len(enemy_keys)
+        static_visible = len(static_index)
+        
+        slots = None
+        if enemy_count:
+            # Динамические треугольники встраиваются в листья BSP-дерева по центрам,
+            # а порядок по удалению от камеры поддерживается между кадрами
+            slots = {}
+            leaf = self.map.bsp.place(centers[static_visible:]).tolist()
+            for i in self.depth_sorter.sort(enemy_keys, depth[static_visible:], cam):
+                slots.setdefault(leaf[i], []).append(static_count + i)
+            
+            self.render_stats['depth_mode'] = self.depth_sorter.mode
+            self.render_stats['depth_moved'] = self.depth_sorter.moved
+        
+        # Порядок от дальних к ближним дает обход BSP-дерева, без сортировки;
+        # обход заходит только в поддеревья с видимыми группами
+        bsp = self.map.bsp
+        order = np.array(bsp.back_to_front(cam, slots, bsp.mask_of(cull_visible)), dtype=np.int64)
+        
+        # Индексы фрагментов переводятся в индексы прошедших отсечение
+        local = order - static_count + static_visible
+        is_static = order < static_count
+        if static_visible:
+            fragments = order[is_static]
+            position = np.minimum(np.searchsorted(static_index, fragments), static_visible - 1)
+            local[is_static] = np.where(static_index[position] == fragments, position, -1)
+        else:
+            local[is_static] = -1
+        return local[local >= 0]
+    
+    def occlusion_cull(self, view_projection, group_visible, cam, width, height):
+        """Растеризация ближайших перекрывателей и отбрасывание закрытых ими групп"""
+        occlusion = self.occlusion
+        occlusion.begin(width, height)
+        group_min = self.map.group_min
+        group_max = self.map.group_max
+        
+        candidates = np.flatnonzero(group_visible & self.map.group_occluder)
+        if len(candidates):
+            distance = np.linalg.norm((group_min[candidates] + group_max[candidates]) / 2 -
+                                      cam.to_tuple(), axis=1)
+            chosen = candidates[np.argsort(distance)[:self.max_occluders]]
+            
+            # Перекрывают только лицевые треугольники перед камерой
+            fragments = np.flatnonzero(np.isin(self.map.static_group, chosen))
+            to_camera = np.array(cam.to_tuple()) - self.map.static_centers[fragments]
+            fragments = fragments[np.einsum('ij,ij->i', self.map.static_normals[fragments], to_camera) < 0]
+            
+            vertices = self.map.static_vertices.reshape(-1, 3, 3)[fragments].reshape(-1, 3)
+            projected = view_projection.transform_points(vertices)
+            z = projected[:, 2].reshape(-1, 3)
+            in_front = np.all((z > 0) & (z < 1), axis=1)
+            screen = ndc_to_screen(projected, width, height).reshape(-1, 3, 2)
+            occlusion.add_occluders(screen[in_front], z[in_front])
+        occlusion.finish()
+        
+        # Рамки, пересекающие ближнюю плоскость, не проверяются
+        visible = np.flatnonzero(group_visible)
+        x0, y0, x1, y1, near, in_front = box_screen_rects(
+            view_projection, group_min[visible], group_max[visible], width, height)
+        passed = occlusion.test_rects(x0[in_front], y0[in_front], x1[in_front], y1[in_front], near[in_front])
+        group_visible[visible[in_front][~passed]] = False
+        
+        self.render_stats['occlusion_occluders'] = occlusion.occluders
+        self.render_stats['occlusion_culled'] = int(np.count_nonzero(~passed))
+    
+    def occlusion_cull_enemies(self, view_projection, enemies, width, height):
+        """Отбрасывание врагов, закрытых перекрывателями текущего кадра"""
+        if not enemies:
+            self.render_stats['occlusion_enemies_culled'] = 0
+            return enemies
+        
+        centers = Vector3Array.from_vectors(enemy.mesh.position for index, enemy in enemies).data
+        radii = np.array([enemy.mesh.get_bounding_radius() for index, enemy in enemies])[:, None]
+        x0, y0, x1, y1, near, in_front = box_screen_rects(
+            view_projection, centers - radii, centers + radii, width, height)
+        passed = np.ones(len(enemies), dtype=bool)
+        passed[in_front] = self.occlusion.test_rects(
+            x0[in_front], y0[in_front], x1[in_front], y1[in_front], near[in_front])
+        
+        self.render_stats['occlusion_enemies_culled'] = int(np.count_nonzero(~passed))
+        return [enemy for enemy, keep in zip(enemies, passed) if keep]
+    
+    def render_zbuffer(self, screen, z, keep, colors, width, height):
+        """Растеризация треугольников в буфер глубины и вывод кадра одной текстурой"""
+        rasterizer = self.rasterizer
+        size = (rasterizer.width, rasterizer.height)
+        
+        # Экранные координаты линейно переводятся во внутреннее разрешение буфера
+        scale = np.array((rasterizer.width / width, rasterizer.height / height))
+        rasterizer.clear()
+        rasterizer.draw_triangles(screen[keep] * scale, z[keep], colors[keep])
+        
+        if self.zbuffer_texture is None or self.zbuffer_texture.size != size:
+            self.zbuffer_texture = Texture.create(size=size, colorfmt='rgba')
+            self.zbuffer_texture.mag_filter = 'nearest'
+            self.zbuffer_rect.texture = self.zbuffer_texture
+        self.zbuffer_texture.blit_buffer(rasterizer.color.tobytes(), colorfmt='rgba', bufferfmt='ubyte')
+        
+        self.zbuffer_rect.pos = (0, 0)
+        self.zbuffer_rect.size = (width, height)
+        self.zbuffer_color.a = 1
+        
+        self.render_stats['zbuffer_fragments'] = rasterizer.fragments
+        self.render_stats['zbuffer_pixels'] = rasterizer.pixels
+    
+    def render_floor(self, view_projection, frustum, width, height):
+        """Отрисовка пола крупными текстурированными плитками"""
+        self.floor_batch.clear()
+        m = view_projection.m
+        near = self.camera.near
+        tiles = 0
+        
+        for x0, z0, x1, z1 in self.map.floor_tiles:
+            if frustum.test_box((x0, 0, z0), (x1, 0, z1)) == Frustum.OUTSIDE:
+                continue
+            
+            # Углы плитки (y = 0) в пространстве отсечения, до деления на w
+            corners = []
+            for x, z in ((x0, z0), (x1, z0), (x1, z1), (x0, z1)):
+                corners.append((
+                    m[0] * x + m[2] * z + m[3],
+                    m[4] * x + m[6] * z + m[7],
+                    m[8] * x + m[10] * z + m[11],
+                    m[12] * x + m[14] * z + m[15],
+                    x / FLOOR_TEXTURE_REPEAT,
+                    z / FLOOR_TEXTURE_REPEAT
+                ))
+            
+            # Часть плитки за ближней плоскостью отрезается, чтобы не делить на w <= 0
+            polygon = clip_polygon_near(corners, near)
+            if len(polygon) < 3:
+                continue
+            
+            points = []
+            tex_coords = []
+            for x, y, z, w, s, t in polygon:
+                points.append(((x / w + 1) * 0.5 * width, (1 - y / w) * 0.5 * height))
+                tex_coords.append((s, t, 1 / w))
+            self.floor_batch.add_polygon(points, tex_coords)
+            tiles += 1
+        
+        self.floor_batch.commit()
+        self.render_stats['floor_tiles'] = tiles
     
     def render(self, canvas, width, height):
         """Отрисовка 3D сцены"""
-        canvas.clear()
+        # Инструкции canvas создаются один раз, дальше меняются только их данные
+        if self.layers_canvas is not canvas:
+            self.create_layers(canvas)
         
         # Отрисовка неба
-        self.render_sky(canvas, width, height)
-        
-        with canvas:
-            # Матрицы проекции и вида
-            aspect = width / height
-            projection = self.camera.get_projection_matrix(aspect)
-            view = self.camera.get_view_matrix()
-            view_projection = projection.multiply(view)
+        self.render_sky(width, height)
+        
+        # Матрицы проекции и вида берутся из кэша камеры; пирамида видимости
+        # пересобирается только вместе с ними
+        aspect = width / height
+        view_projection = self.camera.get_view_projection_matrix(aspect)
+        if self.frustum_matrix is not view_projection:
+            self.frustum_matrix = view_projection
+            self.frustum = Frustum(view_projection)
+        frustum = self.frustum
+        cam = self.camera.position
+        
+        # Отсечение по пирамиде видимости до любой работы с треугольниками:
+        # сначала иерархия рамок объектов и блоков пола
+        group_visible = np.zeros(self.map.group_count, dtype=bool)
+        group_visible[self.map.bvh.query(frustum)] = True
+        self.render_stats['groups_visible'] = int(np.count_nonzero(group_visible))
+        
+        # Затем группы, закрытые ближайшими стенами и платформами
+        if self.occlusion is not None:
+            self.occlusion_cull(view_projection, group_visible, cam, width, height)
+        static_index = np.flatnonzero(group_visible[self.map.static_group])
+        static_count = len(self.map.static_source)
+        cull_visible = np.zeros(self.map.cull_count, dtype=bool)
+        cull_visible[:self.map.group_count] = group_visible
+        
+        # Уровень детализации выбирается по радиусу объекта на экране:
+        # от каждого объекта остаются только фрагменты текущего уровня
+        focal = height / 2 / math.tan(math.radians(self.camera.fov) / 2)
+        if len(self.lod_levels):
+            distance = np.linalg.norm(self.map.lod_centers - cam.to_tuple(), axis=1)
+            sizes = LevelOfDetail.screen_radius(self.map.lod_radii, distance, focal)
+            self.lod_levels = self.map.column_lod.select(sizes, self.lod_levels)
             
-            # Список всех треугольников для сортировки
-            all_triangles = []
+            # В обходе BSP видим только набор текущего уровня каждого объекта
+            cull_visible[self.map.lod_set + self.lod_levels] = group_visible[self.map.lod_group]
             
-            # Добавляем треугольники карты
-            for cell in self.map.grid:
-                for triangle in cell['triangles']:
-                    all_triangles.append((triangle, triangle.color, False))
+            current = np.append(self.lod_levels, -1)[self.map.static_lod_object[static_index]]
+            static_index = static_index[self.map.static_lod_level[static_index] == current]
+            self.render_stats['lod_levels'] = np.bincount(
+                self.lod_levels, minlength=len(COLUMN_LOD_SEGMENTS)).tolist()
+        
+        # Враги двигаются, поэтому их иерархия перестраивается каждый кадр
+        alive = [(index, enemy) for index, enemy in enumerate(self.enemies) if enemy.alive]
+        visible_enemies = []
+        if alive:
+            centers = Vector3Array.from_vectors(enemy.mesh.position for index, enemy in alive).data
+            radii = np.array([enemy.mesh.get_bounding_radius() for index, enemy in alive])[:, None]
+            enemy_bvh = BoundingVolumeHierarchy(centers - radii, centers + radii)
+            visible_enemies = [alive[i] for i in sorted(enemy_bvh.query(frustum))]
+        
+        self.render_stats['enemies_visible'] = len(visible_enemies)
+        if self.occlusion is not None:
+            visible_enemies = self.occlusion_cull_enemies(view_projection, visible_enemies, width, height)
+        
+        # Добавляем треугольники видимых врагов: экземпляры одного шаблона
+        # преобразуются одним умножением на их матрицы модели,
+        # треугольники собираются по индексам
+        instances = {}
+        for enemy_index, enemy in visible_enemies:
+            mesh = enemy.mesh
+            if mesh.lod is not None:
+                size = LevelOfDetail.screen_radius(mesh.get_bounding_radius(),
+                                                   mesh.position.distance_to(cam), focal)
+                mesh.level = min(mesh.lod.select_one(size, mesh.level), len(mesh.levels) - 1)
+            instances.setdefault(mesh.template, []).append((enemy_index, mesh))
+        
+        enemy_corners = []
+        enemy_colors = []
+        enemy_keys = []
+        for template, group in instances.items():
+            points, indices, face_colors = template.get_arrays()
+            matrices = np.array([mesh.get_model_array() for index, mesh in group])
+            world = transform_instances(points, matrices)
+            tints = np.array([mesh.tint for index, mesh in group], dtype=np.float64)
             
-            # Добавляем треугольники объектов карты
-            for obj in self.map.objects:
-                for triangle in obj:
-                    all_triangles.append((triangle, triangle.color, True))
+            enemy_corners.append(world[:, indices].reshape(-1, 3, 3))
+            enemy_colors.append((tints[:, None, :] * face_colors[None, :, :]).reshape(-1, 4))
+            enemy_keys.extend((enemy_index, triangle_index)
+                              for enemy_index, mesh in group
+                              for triangle_index in range(len(indices)))
+        enemy_count = len(enemy_keys)
+        
+        # Статическая геометрия карты уже упакована в массивы вместе с центрами и нормалями
+        vertices = self.map.static_vertices.reshape(-1, 3, 3)[static_index].reshape(-1, 3)
+        colors = self.map.static_colors[static_index]
+        centers = self.map.static_centers[static_index]
+        normals = self.map.static_normals[static_index]
+        is_object = self.map.static_is_object[static_index]
+        
+        if enemy_count:
+            corners = np.concatenate(enemy_corners)
             
-            # Добавляем треугольники врагов
-            for enemy in self.enemies:
-                if enemy.alive:
-                    for triangle in enemy.mesh.triangles:
-                        v1 = enemy.mesh.transform_vertex(triangle.vertices[0])
-                        v2 = enemy.mesh.transform_vertex(triangle.vertices[1])
-                        v3 = enemy.mesh.transform_vertex(triangle.vertices[2])
-                        
-                        transformed_tri = Triangle(v1, v2, v3, triangle.color)
-                        all_triangles.append((transformed_tri, triangle.color, True))
-            
-            # Сортируем треугольники по удаленности от камеры (painter's algorithm)
-            def triangle_depth(tri):
-                center = tri[0].get_center()
-                return (self.camera.position - center).length()
-            
-            all_triangles.sort(key=triangle_depth, reverse=True)
-            
-            # Отрисовываем треугольники
-            for triangle, color, is_object in all_triangles:
-                # Проверяем, смотрит ли треугольник на камеру
-                if not triangle.is_facing_camera(self.camera.position) and is_object:
-                    continue
-                
-                # Проецируем вершины
-                v1_proj = view_projection.multiply_vector(triangle.vertices[0])
-                v2_proj = view_projection.multiply_vector(triangle.vertices[1])
-                v3_proj = view_projection.multiply_vector(triangle.vertices[2])
-                
-                # Проверяем, находятся ли вершины перед камерой
-                if (v1_proj.z > 0 and v1_proj.z < 1 and
-                    v2_proj.z > 0 and v2_proj.z < 1 and
-                    v3_proj.z > 0 and v3_proj.z < 1):
-                    
-                    # Преобразуем в координаты экрана
-                    def to_screen(v):
-                        x = (v.x + 1) * 0.5 * width
-                        y = (1 - v.y) * 0.5 * height
-                        return (x, y)
-                    
-                    screen1 = to_screen(v1_proj)
-                    screen2 = to_screen(v2_proj)
-                    screen3 = to_screen(v3_proj)
-                    
-                    # Рисуем треугольник
-                    Color(*color)
-                    Mesh(
-                        vertices=[screen1[0], screen1[1], 0, 0,
-                                 screen2[0], screen2[1], 0, 0,
-                                 screen3[0], screen3[1], 0, 0],
-                        indices=[0, 1, 2],
-                        mode='triangles'
-                    )
-            
-            # Эффект попадания по врагу
-            if self.hit_marker > 0:
-                Color(1, 0, 0, 0.3)
-                Rectangle(pos=(0, 0), size=(width, height))
-            
-            # Кровавый экран при получении урона
-            if self.blood_overlay > 0:
-                alpha = self.blood_overlay / 15.0
-                Color(1, 0, 0, alpha * 0.5)
-                Rectangle(pos=(0, 0), size=(width, height))
-            
-            # Эффект тряски экрана при выстреле
-            if self.screen_shake > 0:
-                shake_x = random.randint(-3, 3)
-                shake_y = random.randint(-3, 3)
-                Translate(shake_x, shake_y)
+            # Все вершины кадра в одном непрерывном массиве (n * 3, 3)
+            vertices = np.concatenate((vertices, corners.reshape(-1, 3)))
+            colors = np.concatenate([colors] + enemy_colors)
+            centers = np.concatenate((centers, (corners[:, 0] + corners[:, 1] + corners[:, 2]) / 3))
+            normals = np.concatenate((normals, triangle_normals(corners)))
+            is_object = np.concatenate((is_object, np.ones(enemy_count, dtype=bool)))
+        
+        # Один пакетный проход: вектор к камере дает и отсечение задних граней,
+        # и квадрат расстояния для сортировки
+        to_camera = np.array(cam.to_tuple()) - centers
+        facing = np.einsum('ij,ij->i', normals, to_camera) < 0
+        depth = np.einsum('ij,ij->i', to_camera, to_camera)
+        
+        # Проецируем все вершины разом
+        projected = view_projection.transform_points(vertices)
+        z = projected[:, 2].reshape(-1, 3)
+        in_front = np.all((z > 0) & (z < 1), axis=1)
+        
+        # Остаются треугольники перед камерой и, для объектов, повернутые к ней
+        keep = in_front & (facing | ~is_object)
+        screen = ndc_to_screen(projected, width, height).reshape(-1, 3, 2)
+        
+        # Отсечение в экранных координатах: за краем экрана, вырожденные и мельче пикселя
+        candidates = np.flatnonzero(keep)
+        offscreen, degenerate, tiny = screen_space_cull(
+            screen[candidates], width, height, self.min_triangle_area)
+        keep[candidates[offscreen | degenerate | tiny]] = False
+        
+        self.render_stats['triangles_submitted'] = len(candidates) - int(
+            np.count_nonzero(offscreen) + np.count_nonzero(degenerate) + np.count_nonzero(tiny))
+        self.render_stats['culled_offscreen'] = int(np.count_nonzero(offscreen))
+        self.render_stats['culled_degenerate'] = int(np.count_nonzero(degenerate))
+        self.render_stats['culled_tiny'] = int(np.count_nonzero(tiny))
+        
+        self.world_batch.clear()
+        if self.render_mode == 'zbuffer':
+            self.render_zbuffer(screen, z, keep, colors, width, height)
+        else:
+            self.zbuffer_color.a = 0
+            
+            # Видимые треугольники в порядке отрисовки уходят одним буфером
+            # вершин с цветом на вершину
+            order = self.painter_order(static_index, static_count, centers, depth, enemy_keys, cam,
+                                       cull_visible)
+            visible = order[keep[order]]
+            self.world_batch.add_triangles(screen[visible], colors[visible])
+        self.world_batch.commit()
+        
+        if self.floor_mode == 'texture':
+            self.render_floor(view_projection, frustum, width, height)
+        
+        # Эффект попадания по врагу
+        self.hit_color.a = 0.3 if self.hit_marker > 0 else 0
+        
+        # Кровавый экран при получении урона
+        alpha = self.blood_overlay / 15.0
+        self.blood_color.a = alpha * 0.5 if self.blood_overlay > 0 else 0
+        
+        # Эффект тряски экрана при выстреле
+        if self.screen_shake > 0:
+            self.shake.xy = (random.randint(-3, 3), random.randint(-3, 3))
+        else:
+            self.shake.xy = (0, 0)